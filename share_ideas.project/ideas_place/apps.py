@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class IdeasPlaceConfig(AppConfig):
     name = 'ideas_place'
+
+    def ready(self):
+        from .signals import create_search_index
+        post_migrate.connect(create_search_index, sender=self, dispatch_uid='ideas_place_search_index')
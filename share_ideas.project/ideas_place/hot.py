@@ -0,0 +1,67 @@
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import HotIdea, Idea
+from .sharding import shard_aliases
+
+# -------- "Hot ideas" ranking -------------------
+# score = log10(net votes) + date_published / decay, the time decay is relative: a newer idea
+# needs ten times fewer net votes per HOT_IDEAS_DECAY_SECONDS to rank as high as an older one.
+# The score only changes when the idea's votes change, so a refresh recomputes
+# just the ideas updated since the previous run.
+
+SCORE_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def hot_score(overall_likes, overall_unlikes, date_published):
+    decay = getattr(settings, 'HOT_IDEAS_DECAY_SECONDS', 45000)
+    net_votes = overall_likes - overall_unlikes
+    order = math.log10(max(abs(net_votes), 1))
+    sign = (net_votes > 0) - (net_votes < 0)
+    return round(sign * order + (date_published - SCORE_EPOCH).total_seconds() / decay, 7)
+
+
+def refresh_hot_ideas(full=False, overlap_seconds=60, chunk_size=1000):
+    """
+    Recompute the scores of the ideas changed since the previous refresh
+    (all the ideas when full is True), return the number of refreshed ideas.
+    The ranking of every shard is kept on the shard, next to its ideas.
+    """
+    return sum(_refresh_shard(using, full, overlap_seconds, chunk_size) for using in shard_aliases())
+
+
+def _refresh_shard(using, full, overlap_seconds, chunk_size):
+    started_at = timezone.now()
+    last_refresh = None if full else HotIdea.objects.using(using).aggregate(last=Max('refreshed_at'))['last']
+
+    changed_ideas = Idea.objects.using(using).order_by('pk')
+    if last_refresh is not None:
+        # ---------- the overlap catches votes committed after the previous refresh had read its rows
+        changed_ideas = changed_ideas.filter(updated_at__gte=last_refresh - timedelta(seconds=overlap_seconds))
+    rows = changed_ideas.values_list('pk', 'overall_likes', 'overall_unlikes', 'date_published')
+
+    refreshed = 0
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            refreshed += _save_scores(chunk, started_at, using)
+            chunk = []
+    refreshed += _save_scores(chunk, started_at, using)
+    return refreshed
+
+
+def _save_scores(rows, refreshed_at, using=None):
+    if not rows:
+        return 0
+    hot_ideas = [HotIdea(idea_id=pk, score=hot_score(likes, unlikes, published), refreshed_at=refreshed_at)
+                 for pk, likes, unlikes, published in rows]
+    with transaction.atomic(using=using):
+        HotIdea.objects.using(using).filter(pk__in=[hot_idea.idea_id for hot_idea in hot_ideas]).delete()
+        HotIdea.objects.using(using).bulk_create(hot_ideas)
+    return len(hot_ideas)
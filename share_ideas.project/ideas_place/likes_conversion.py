@@ -0,0 +1,78 @@
+from django.db import models, transaction
+from django.db.migrations.state import ModelState, ProjectState
+from django.db.models import Case, Value, When
+
+# -------- Likes.is_like/is_unlike to Likes.vote -------------------
+# The pair of nullable booleans became one small integer (1 like, 0 no vote, -1 unlike).
+# As a migration: AddField(vote), RunPython(convert_likes_flags), RemoveField(is_like),
+# RemoveField(is_unlike), with `atomic = False` on the migration, or the chunks of the
+# conversion run in the one transaction of the migration.
+# The project keeps no migrations, convert_likes_votes() runs the same steps on an existing database.
+
+# ---------- the values of Likes.vote, historical models have no class constants
+LIKE = 1
+NO_VOTE = 0
+UNLIKE = -1
+
+FLAGS = ('is_like', 'is_unlike')
+
+
+def convert_likes_flags(apps, schema_editor, chunk_size=5000):
+    """
+    RunPython step: fill Likes.vote from is_like/is_unlike, one transaction per chunk of ids.
+    A contradictory row (both flags set) becomes a like.
+    Return (converted, contradictory) row counts.
+    """
+    likes_model = apps.get_model('ideas_place', 'Likes')
+    likes = likes_model.objects.using(schema_editor.connection.alias)
+    contradictory = likes.filter(is_like=True, is_unlike=True).count()
+    max_id = likes.aggregate(max_id=models.Max('pk'))['max_id'] or 0
+    vote = Case(When(is_like=True, then=Value(LIKE)), When(is_unlike=True, then=Value(UNLIKE)),
+                default=Value(NO_VOTE))
+    converted = 0
+    for start in range(0, max_id, chunk_size):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            converted += likes.filter(pk__gt=start, pk__lte=start + chunk_size).update(vote=vote)
+    return converted, contradictory
+
+
+def _state_apps(apps, likes_fields):
+    """
+    Models of a migration state where Likes has `likes_fields`, the other models as they are now.
+    """
+    state = ProjectState.from_apps(apps)
+    likes_state = state.models['ideas_place', 'likes']
+    state.remove_model('ideas_place', 'likes')
+    state.add_model(ModelState('ideas_place', likes_state.name, likes_fields, likes_state.options,
+                               likes_state.bases, likes_state.managers))
+    return state.apps
+
+
+def convert_likes_votes(apps, schema_editor, chunk_size=5000):
+    """
+    Run the steps of the migration on a database which still has the is_like/is_unlike columns.
+    Return (converted, contradictory) row counts, (0, 0) when there is nothing to convert.
+    """
+    connection = schema_editor.connection
+    likes_model = apps.get_model('ideas_place', 'Likes')
+    with connection.cursor() as cursor:
+        columns = {column.name for column in connection.introspection.get_table_description(
+            cursor, likes_model._meta.db_table)}
+    if not set(FLAGS) <= columns:
+        return 0, 0
+
+    fields = [(name, field) for name, field in ModelState.from_model(likes_model).fields if name != 'vote']
+    fields += [(name, models.NullBooleanField()) for name in FLAGS]
+    fields.append(('vote', likes_model._meta.get_field('vote').clone()))
+    state_apps = _state_apps(apps, fields)
+    if likes_model._meta.get_field('vote').column not in columns:
+        historical_likes = state_apps.get_model('ideas_place', 'Likes')
+        schema_editor.add_field(historical_likes, historical_likes._meta.get_field('vote'))
+
+    result = convert_likes_flags(state_apps, schema_editor, chunk_size)
+    for flag in FLAGS:
+        historical_likes = state_apps.get_model('ideas_place', 'Likes')
+        schema_editor.remove_field(historical_likes, historical_likes._meta.get_field(flag))
+        fields = [(name, field) for name, field in fields if name != flag]
+        state_apps = _state_apps(apps, fields)
+    return result
@@ -0,0 +1,20 @@
+from django.db.models import Max
+
+# -------- One Likes row per (idea, user) -------------------
+# Before the unique_user_vote constraint, a double submitted vote could leave several rows for the
+# same idea and user. They must go before the constraint is added to an existing database:
+# run the dedupe_likes command (or dedupe_likes() as the RunPython step before the AddConstraint
+# of a migration), then rebuild_likes_counters, the counters had counted every duplicate.
+
+
+def dedupe_likes(apps, schema_editor):
+    """
+    Delete all but the newest row (highest id, the last vote) of every (idea, user) pair.
+    Rows without a user (deleted voters) are not duplicates for the constraint and stay.
+    Return the number of deleted rows.
+    """
+    likes_model = apps.get_model('ideas_place', 'Likes')
+    likes = likes_model.objects.using(schema_editor.connection.alias)
+    kept = likes.values('parent_idea', 'user').annotate(kept=Max('pk')).values('kept')
+    deleted, _ = likes.exclude(user=None).exclude(pk__in=kept).delete()
+    return deleted
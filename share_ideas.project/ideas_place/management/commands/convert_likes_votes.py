@@ -0,0 +1,22 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ideas_place.likes_conversion import convert_likes_votes
+
+
+class Command(BaseCommand):
+    help = "Convert the former Likes.is_like/is_unlike columns into Likes.vote."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to convert the likes in.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Likes ids converted per transaction.')
+
+    def handle(self, *args, **options):
+        with connections[options['database']].schema_editor(atomic=False) as schema_editor:
+            converted, contradictory = convert_likes_votes(apps, schema_editor, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('{} like(s) converted'.format(converted)))
+        if contradictory:
+            # ---------- they were counted as both, the counters need a repair
+            self.stdout.write(self.style.WARNING(
+                '{} like(s) had both flags and became likes, run rebuild_likes_counters'.format(contradictory)))
@@ -0,0 +1,18 @@
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ideas_place.likes_dedupe import dedupe_likes
+
+
+class Command(BaseCommand):
+    help = "Keep the last vote of every (idea, user) pair before the unique_user_vote constraint " \
+           "is added, then rebuild the likes counters."
+
+    def handle(self, *args, **options):
+        # ---------- one DELETE statement
+        with connection.schema_editor(atomic=False) as schema_editor:
+            deleted = dedupe_likes(apps, schema_editor)
+        self.stdout.write(self.style.SUCCESS('{} duplicate like(s) deleted'.format(deleted)))
+        call_command('rebuild_likes_counters', stdout=self.stdout)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ideas_place.transfer import export_lines
+
+
+class Command(BaseCommand):
+    help = "Export all the ideas as NDJSON, one idea per line."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='File to write, stdout by default.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Ideas fetched from the database at once.')
+
+    def handle(self, *args, **options):
+        lines = export_lines(chunk_size=options['chunk_size'])
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.writelines(lines)
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ideas_place.transfer import IdeasImportError, import_lines
+
+
+class Command(BaseCommand):
+    help = "Import ideas from an NDJSON file made by `export_ideas`."
+    stealth_options = ('stdin',)
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="NDJSON file to read, '-' for stdin.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Ideas written with one bulk insert.')
+        parser.add_argument('--keep-ids', action='store_true', help='Keep the exported ids, e.g. to restore a backup.')
+
+    def handle(self, *args, **options):
+        import_options = {'chunk_size': options['chunk_size'], 'keep_ids': options['keep_ids']}
+        try:
+            if options['input'] == '-':
+                created, unknown_authors = import_lines(options.get('stdin', sys.stdin), **import_options)
+            else:
+                with open(options['input'], encoding='utf-8') as lines:
+                    created, unknown_authors = import_lines(lines, **import_options)
+        except IdeasImportError as e:
+            raise CommandError(e)
+
+        if unknown_authors:
+            self.stdout.write(self.style.WARNING('{} idea(s) imported without author, username not found'.format(
+                unknown_authors)))
+        self.stdout.write(self.style.SUCCESS('{} idea(s) imported'.format(created)))
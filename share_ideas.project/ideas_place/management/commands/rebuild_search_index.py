@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ideas_place.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of ideas' titles and texts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild the index in.')
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('{} idea(s) indexed'.format(indexed)))
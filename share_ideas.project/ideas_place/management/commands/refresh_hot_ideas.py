@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ideas_place.hot import refresh_hot_ideas
+
+
+class Command(BaseCommand):
+    help = "Refresh the hot ideas ranking for the ideas changed since the previous run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute the scores of all the ideas.')
+        parser.add_argument('--loop', action='store_true', help='Keep refreshing instead of exiting.')
+        parser.add_argument('--interval', type=float, default=60, help='Refresh interval in seconds for --loop.')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            refreshed = refresh_hot_ideas(full=full)
+            self.stdout.write('{} idea(s) refreshed'.format(refreshed))
+            if not options['loop']:
+                break
+            full = False
+            time.sleep(options['interval'])
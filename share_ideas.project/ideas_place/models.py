@@ -1,28 +1,137 @@
 from django.db import models
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Value, When
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
 from users.models import CustomUser
 from django.dispatch import receiver
+from .sharding import allocate_idea_id, is_sharded, shard_for_author, users_constraint
 
 
 # Create your models here.
 
 
+class IdeaQuerySet(models.QuerySet):
+    def with_vote_of(self, user):
+        """
+        Annotate ideas with the given user's own vote (user_vote, None without a vote),
+        so the detail view doesn't need a separate Likes lookup.
+        """
+        users_likes = Likes.objects.filter(parent_idea=OuterRef('pk'), user=user.pk)
+        return self.annotate(user_vote=Subquery(users_likes.values('vote')[:1]))
+
+    def shift_likes_counters(self, deltas):
+        """
+        Shift overall_likes/overall_unlikes by {idea_id: (likes_delta, unlikes_delta)}
+        with a single UPDATE, must run in the same transaction as the related Likes write.
+        """
+        deltas = {idea_id: delta for idea_id, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return 0
+
+        def delta_of(position):
+            return Case(*[When(pk=idea_id, then=Value(delta[position])) for idea_id, delta in deltas.items()],
+                        default=Value(0), output_field=IntegerField())
+
+        return self.filter(pk__in=deltas).update(overall_likes=F('overall_likes') + delta_of(0),
+                                                 overall_unlikes=F('overall_unlikes') + delta_of(1),
+                                                 updated_at=timezone.now())
+
+
 class Idea(models.Model):
     i_title = models.CharField(max_length=255, verbose_name=_('Ideas Title'),
                                blank=False, default="My New Ideas TITLE")
     i_text = models.TextField(null=False, blank=False, verbose_name=_('An incredible Idea'),
                               default="My New Idea about ...")
+    # ---------- no database constraint with IDEA_SHARDS, the ideas live on other databases than the users
     author = models.ForeignKey(CustomUser, verbose_name=_('Idea Author'), null=True, default=None,
-                               on_delete=models.SET_NULL, related_name='ideas')
+                               on_delete=models.SET_NULL, related_name='ideas', db_constraint=users_constraint())
     date_published = models.DateTimeField(verbose_name=_('date published'), default=timezone.now)
+    # ---------- denormalized Likes counters, maintained together with every Likes write
+    overall_likes = models.IntegerField(verbose_name=_('overall likes'), default=0)
+    overall_unlikes = models.IntegerField(verbose_name=_('overall unlikes'), default=0)
+    # ---------- conditional GET validator, touched by every save and by likes changes
+    updated_at = models.DateTimeField(verbose_name=_('date updated'), auto_now=True)
+
+    objects = IdeaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # ---------- keyset pagination of the ideas list
+            models.Index(fields=['-date_published', '-id'], name='idea_published_idx'),
+            # ---------- changed ideas lookup of the hot ideas refresh
+            models.Index(fields=['updated_at'], name='idea_updated_idx'),
+            # ---------- keyset pagination of an author's ideas
+            models.Index(fields=['author', '-date_published', '-id'], name='idea_author_published_idx'),
+        ]
 
     def __str__(self):
         return self.i_title
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and is_sharded():
+            # ---------- a new idea goes to its author's shard, with an id telling that shard
+            kwargs['using'] = shard_for_author(self.author_id)
+            if self.pk is None:
+                self.pk = allocate_idea_id(kwargs['using'])
+                kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
+
+
+class IdeaIdSequence(models.Model):
+    """
+    Idea ids allocator of a shard, used with IDEA_SHARDS only (see ideas_place.sharding).
+    """
+
 
 class Likes(models.Model):
+    LIKE = 1
+    NO_VOTE = 0
+    UNLIKE = -1
+    VOTE_CHOICES = [(LIKE, _('like')), (NO_VOTE, _('no vote')), (UNLIKE, _('unlike'))]
+
     parent_idea = models.ForeignKey(Idea, blank=False, null=False, on_delete=models.CASCADE, related_name='likes')
-    user = models.ForeignKey(CustomUser, null=True, default=None, on_delete=models.SET_NULL)
-    is_like = models.BooleanField(blank=True, null=True, default=False)
-    is_unlike = models.BooleanField(blank=True, null=True, default=False)
+    user = models.ForeignKey(CustomUser, null=True, default=None, on_delete=models.SET_NULL,
+                             db_constraint=users_constraint())
+    vote = models.SmallIntegerField(verbose_name=_('vote'), choices=VOTE_CHOICES, default=NO_VOTE)
+
+    class Meta:
+        constraints = [
+            # ---------- one vote per user and idea, also the conflict target of the votes upsert;
+            # run dedupe_likes before adding it to an existing database (see .likes_dedupe)
+            models.UniqueConstraint(fields=['parent_idea', 'user'], name='unique_user_vote'),
+        ]
+
+    # ---------- the is_like/is_unlike flags of the API, setting one clears the other
+    @property
+    def is_like(self):
+        return self.vote == self.LIKE
+
+    @is_like.setter
+    def is_like(self, value):
+        if value:
+            self.vote = self.LIKE
+        elif self.vote == self.LIKE:
+            self.vote = self.NO_VOTE
+
+    @property
+    def is_unlike(self):
+        return self.vote == self.UNLIKE
+
+    @is_unlike.setter
+    def is_unlike(self, value):
+        if value:
+            self.vote = self.UNLIKE
+        elif self.vote == self.UNLIKE:
+            self.vote = self.NO_VOTE
+
+
+class HotIdea(models.Model):
+    """
+    Materialized "hot ideas" ranking, refreshed by the `refresh_hot_ideas` command.
+    """
+    idea = models.OneToOneField(Idea, primary_key=True, on_delete=models.CASCADE, related_name='hotness')
+    score = models.FloatField(verbose_name=_('hot score'), db_index=True)
+    refreshed_at = models.DateTimeField(verbose_name=_('date refreshed'), db_index=True)
+
+    def __str__(self):
+        return '{} ({:.4f})'.format(self.idea_id, self.score)
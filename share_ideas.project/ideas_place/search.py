@@ -0,0 +1,125 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Idea
+
+# -------- Full-text index over ideas' titles and texts -------------------
+# SQLite: external content FTS5 table over ideas_place_idea, rowid is the idea id. It keeps only
+#         the index, the texts are read from the ideas table. Triggers on the ideas table keep it in
+#         sync, also for bulk_create() and queryset deletes; the counters updates don't touch it.
+# PostgreSQL: GIN expression index over the tsvector, kept in sync by the database.
+# Other backends fall back to a plain icontains filter.
+
+FTS_TABLE = 'ideas_place_idea_fts'
+FTS_TRIGGERS = (
+    ('ideas_place_idea_fts_insert', 'AFTER INSERT ON {table} BEGIN {insert_new}; END'),
+    ('ideas_place_idea_fts_delete', 'AFTER DELETE ON {table} BEGIN {delete_old}; END'),
+    ('ideas_place_idea_fts_update', 'AFTER UPDATE OF {title}, {text} ON {table} BEGIN {delete_old}; {insert_new}; END'),
+)
+PG_INDEX = 'ideas_place_idea_search_idx'
+PG_DOCUMENT = "to_tsvector('english', {title} || ' ' || {text})"
+
+
+def _backend(connection):
+    if connection.vendor == 'sqlite':
+        return 'fts5'
+    if connection.vendor == 'postgresql':
+        return 'tsvector'
+    return None
+
+
+def _idea_columns(connection):
+    quote = connection.ops.quote_name
+    meta = Idea._meta
+    return (quote(meta.db_table), quote(meta.pk.column),
+            quote(meta.get_field('i_title').column), quote(meta.get_field('i_text').column))
+
+
+def _create_fts_table(cursor, connection):
+    table, pk, title, text = _idea_columns(connection)
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+    row = cursor.fetchone()
+    if row is not None and 'content=' in row[0]:
+        return False
+    if row is not None:
+        # ---------- the former FTS5 table with its own copy of the texts
+        cursor.execute('DROP TABLE {}'.format(FTS_TABLE))
+    # ---------- the FTS5 columns take the names of the ideas table's columns they read
+    cursor.execute("CREATE VIRTUAL TABLE {} USING fts5({}, {}, content='{}', content_rowid='{}', "
+                   "tokenize='porter unicode61')".format(FTS_TABLE, title, text, Idea._meta.db_table,
+                                                         Idea._meta.pk.column))
+    values = {'table': table, 'title': title, 'text': text,
+              'insert_new': 'INSERT INTO {fts}(rowid, {title}, {text}) VALUES (new.{pk}, new.{title}, new.{text})',
+              'delete_old': "INSERT INTO {fts}({fts}, rowid, {title}, {text}) "
+                            "VALUES ('delete', old.{pk}, old.{title}, old.{text})"}
+    for key in ('insert_new', 'delete_old'):
+        values[key] = values[key].format(fts=FTS_TABLE, pk=pk, title=title, text=text)
+    for name, trigger in FTS_TRIGGERS:
+        cursor.execute('DROP TRIGGER IF EXISTS {}'.format(name))
+        cursor.execute('CREATE TRIGGER {} {}'.format(name, trigger.format(**values)))
+    return True
+
+
+def ensure_search_index(using='default'):
+    connection = connections[using]
+    backend = _backend(connection)
+    with connection.cursor() as cursor:
+        if backend == 'fts5':
+            if _create_fts_table(cursor, connection):
+                # ---------- index the ideas already there
+                cursor.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(FTS_TABLE))
+        elif backend == 'tsvector':
+            table, _, title, text = _idea_columns(connection)
+            cursor.execute('CREATE INDEX IF NOT EXISTS {} ON {} USING GIN ({})'.format(
+                PG_INDEX, table, PG_DOCUMENT.format(title=title, text=text)))
+
+
+def rebuild_search_index(using='default'):
+    """
+    Rebuild the index from the ideas table, return the number of indexed ideas.
+    """
+    connection = connections[using]
+    ensure_search_index(using)
+    if _backend(connection) == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(FTS_TABLE))
+    # ---------- on PostgreSQL the database maintains the expression index itself
+    return Idea.objects.using(using).count()
+
+
+def search_idea_ids(query, limit, offset=0, using=None):
+    """
+    Return ids of the ideas matching all the words of the query, best ranked first.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return []
+    using = using or router.db_for_read(Idea)
+    connection = connections[using]
+    backend = _backend(connection)
+
+    if backend == 'fts5':
+        # ---------- quoted words, so user input is never parsed as FTS5 query syntax
+        match = ' '.join('"{}"'.format(word) for word in words)
+        sql = 'SELECT rowid FROM {} WHERE {} MATCH %s ORDER BY rank, rowid DESC LIMIT %s OFFSET %s'.format(
+            FTS_TABLE, FTS_TABLE)
+        params = [match, limit, offset]
+    elif backend == 'tsvector':
+        table, pk, title, text = _idea_columns(connection)
+        document = PG_DOCUMENT.format(title=title, text=text)
+        sql = "SELECT {pk} FROM {table} WHERE {document} @@ plainto_tsquery('english', %s) " \
+              "ORDER BY ts_rank({document}, plainto_tsquery('english', %s)) DESC, {pk} DESC " \
+              "LIMIT %s OFFSET %s".format(pk=pk, table=table, document=document)
+        params = [' '.join(words), ' '.join(words), limit, offset]
+    else:
+        condition = Q()
+        for word in words:
+            condition &= Q(i_title__icontains=word) | Q(i_text__icontains=word)
+        return list(Idea.objects.using(using).filter(condition).order_by('-date_published', '-id')
+                    .values_list('pk', flat=True)[offset:offset + limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,132 @@
+import zlib
+
+from django.conf import settings
+
+# -------- Author sharding of ideas -------------------
+# With IDEA_SHARDS (aliases of DATABASES) set, an idea, its likes and its hot score live on the
+# shard picked by a hash of the author id, so all the ideas of an author are on one shard.
+# The idea id tells its shard: ids are allocated on the shard (IdeaIdSequence) as
+# sequence * len(IDEA_SHARDS) + shard index, a lookup by id goes straight to one shard.
+# Users stay on 'default'. With IDEA_SHARDS, Idea.author and Likes.user are declared without a
+# database constraint: the database no longer refuses an idea or a vote of a missing user, and
+# nulls none of them when a user is deleted (see ideas_place.signals). Unsharded, the constraints
+# stay. IDEA_SHARDS is read when the models are loaded, the migrations follow the setting.
+# The number of shards can't change without moving the ideas to their new shards.
+# Not shard-aware yet: the full-text search, the NDJSON export and rebuild_likes_counters read
+# 'default' only, the NDJSON import refuses to run.
+#
+# The helpers return None for "not sharded", queryset.using(None) leaves the choice to the routers.
+
+SHARDED_MODELS = ('idea', 'likes', 'hotidea', 'ideaidsequence')
+
+
+def get_shards():
+    return list(getattr(settings, 'IDEA_SHARDS', ()))
+
+
+def is_sharded():
+    return bool(get_shards())
+
+
+def users_constraint():
+    """
+    db_constraint of the foreign keys from the sharded models to the users.
+    """
+    return not is_sharded()
+
+
+def shard_aliases():
+    """
+    The shards to visit for a query over all the ideas, [None] when not sharded.
+    """
+    return get_shards() or [None]
+
+
+def per_shard(queryset):
+    return [queryset.using(alias) for alias in shard_aliases()]
+
+
+def shard_for_author(author_id):
+    shards = get_shards()
+    if not shards:
+        return None
+    if author_id is None:
+        return shards[0]
+    return shards[zlib.crc32(str(author_id).encode('ascii')) % len(shards)]
+
+
+def shard_for_idea(idea_id):
+    shards = get_shards()
+    if not shards:
+        return None
+    return shards[int(idea_id) % len(shards)]
+
+
+def group_by_shard(idea_ids):
+    """
+    Return {alias: [idea ids]}, {None: idea_ids} when not sharded.
+    """
+    groups = {}
+    for idea_id in idea_ids:
+        groups.setdefault(shard_for_idea(idea_id), []).append(idea_id)
+    return groups
+
+
+def allocate_idea_id(alias):
+    from .models import IdeaIdSequence
+
+    shards = get_shards()
+    return IdeaIdSequence.objects.using(alias).create().pk * len(shards) + shards.index(alias)
+
+
+class IdeaShardRouter:
+    """
+    Send the queries of the sharded models to the shard of the instance they are about.
+    Without an instance hint the next routers decide, pass .using(alias) for such queries.
+    """
+    @staticmethod
+    def is_sharded_model(model):
+        return model._meta.app_label == 'ideas_place' and model._meta.model_name in SHARDED_MODELS
+
+    def shard_of(self, model, instance):
+        if isinstance(instance, model):
+            if not instance._state.adding and instance._state.db:
+                # ---------- a loaded row stays where it was read from
+                return instance._state.db
+            if model._meta.model_name == 'idea':
+                return shard_for_author(instance.author_id)
+            if model._meta.model_name == 'likes':
+                return shard_for_idea(instance.parent_idea_id) if instance.parent_idea_id is not None else None
+            if model._meta.model_name == 'hotidea':
+                return shard_for_idea(instance.idea_id) if instance.idea_id is not None else None
+            return None
+        if self.is_sharded_model(type(instance)):
+            # ---------- related rows of an idea, e.g. idea.likes.all()
+            if instance._state.db or instance.pk is None:
+                return instance._state.db
+            return shard_for_idea(instance.pk)
+        if model._meta.model_name == 'idea' and instance.pk is not None:
+            # ---------- the ideas of a user, e.g. user.ideas.all()
+            return shard_for_author(instance.pk)
+        return None
+
+    def _db(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is None or not is_sharded() or not self.is_sharded_model(model):
+            return None
+        return self.shard_of(model, instance)
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not is_sharded():
+            return None
+        sharded = [self.is_sharded_model(type(obj)) for obj in (obj1, obj2)]
+        if all(sharded):
+            # ---------- an unsaved row goes to the shard of its idea when saved
+            return obj1._state.adding or obj2._state.adding or obj1._state.db == obj2._state.db
+        if any(sharded):
+            # ---------- authors and voters live on 'default'
+            return True
+        return None
@@ -0,0 +1,25 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from users.models import CustomUser
+from .models import Idea, Likes
+from .search import ensure_search_index
+from .sharding import get_shards, shard_for_author
+
+# ---------- sent with `ideas` and `using` after Idea.objects.bulk_create(), which sends no post_save
+ideas_bulk_created = Signal()
+
+
+def create_search_index(sender, using='default', **kwargs):
+    ensure_search_index(using)
+
+
+@receiver(pre_delete, sender=CustomUser, dispatch_uid='ideas_user_deleted')
+def release_user_rows(sender, instance, **kwargs):
+    # ---------- ahead of the on_delete SET_NULL of the user deletion, which leaves updated_at (the
+    # conditional GET validators) as it was and only sees the ideas on 'default'
+    Idea.objects.using(shard_for_author(instance.pk)).filter(author_id=instance.pk).update(
+        author=None, updated_at=timezone.now())
+    for alias in get_shards():
+        Likes.objects.using(alias).filter(user_id=instance.pk).update(user=None)
@@ -1,3 +1,208 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from django.apps import apps
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.state import ProjectState
+from django.test import TestCase, TransactionTestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_api.email import account_activation_token
+from rest_api.serializers import LikesSerializer
+from users.models import CustomUser
+from .hot import refresh_hot_ideas
+from .models import HotIdea, Idea, Likes
+from .votes import apply_votes
 
 # Create your tests here.
+
+
+class LikesCountersTest(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user(username='author', email='author@example.com',
+                                                     password='Testpassword123', is_active=True)
+        self.voter = CustomUser.objects.create_user(username='voter', email='voter@example.com',
+                                                    password='Testpassword123', is_active=True)
+        self.idea = Idea.objects.create(i_title='Idea', i_text='Text', author=self.author)
+
+    def assertCounters(self, likes, unlikes):
+        self.idea.refresh_from_db()
+        self.assertEqual((self.idea.overall_likes, self.idea.overall_unlikes), (likes, unlikes))
+
+    def test_counters_follow_likes_writes(self):
+        print('test_counters_follow_likes_writes-1')
+        serializer = LikesSerializer(data={'parent_idea': self.idea.pk, 'user': self.voter.pk,
+                                           'is_like': True, 'is_unlike': False})
+        serializer.is_valid(raise_exception=True)
+        like = serializer.save()
+        self.assertCounters(1, 0)
+
+        # ---------- switch the vote
+        serializer = LikesSerializer(instance=like, data={'is_like': False, 'is_unlike': True}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertCounters(0, 1)
+
+        # ---------- a like replaces the unlike
+        serializer = LikesSerializer(instance=like, data={'is_like': True}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertCounters(1, 0)
+
+        # ---------- a vote can't be both
+        serializer = LikesSerializer(instance=like, data={'is_like': True, 'is_unlike': True}, partial=True)
+        self.assertFalse(serializer.is_valid())
+
+    def test_rebuild_likes_counters_command(self):
+        print('test_rebuild_likes_counters_command-2')
+        Likes.objects.create(parent_idea=self.idea, user=self.voter, is_like=True, is_unlike=False)
+        Likes.objects.create(parent_idea=self.idea, user=self.author, is_like=False, is_unlike=True)
+        self.assertCounters(0, 0)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_likes_counters', '--check', stdout=StringIO())
+
+        out = StringIO()
+        call_command('rebuild_likes_counters', stdout=out)
+        self.assertIn('1 idea(s) repaired', out.getvalue())
+        self.assertCounters(1, 1)
+
+        out = StringIO()
+        call_command('rebuild_likes_counters', '--check', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+    def test_votes_upsert_keeps_one_row_per_user(self):
+        print('test_votes_upsert_keeps_one_row_per_user-3')
+        for is_like in (True, False, True, True):
+            apply_votes([(self.idea.pk, self.voter.pk, {'is_like': is_like, 'is_unlike': not is_like})])
+        self.assertEqual(Likes.objects.filter(parent_idea=self.idea, user=self.voter).count(), 1)
+        self.assertCounters(1, 0)
+
+        # ---------- coalesced in one call, the last vote wins
+        saved = apply_votes([(self.idea.pk, self.author.pk, {'is_like': True}),
+                             (self.idea.pk, self.author.pk, {'is_like': False, 'is_unlike': True})])
+        self.assertEqual(saved, {(self.idea.pk, self.author.pk): Likes.UNLIKE})
+        self.assertCounters(1, 1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Likes.objects.create(parent_idea=self.idea, user=self.voter, is_like=True)
+
+
+class UserActivationViewTest(TestCase):
+    def setUp(self):
+        self.new_user = CustomUser.objects.create_user(username='newuser', email='new@example.com',
+                                                       password='Testpassword123', is_active=False)
+        self.activation_url = reverse('ideas_place:user-activation', kwargs={
+            'uidb64': urlsafe_base64_encode(force_bytes(self.new_user.pk)),
+            'token': account_activation_token.make_token(self.new_user)})
+
+    def test_activation_page_activates_in_process(self):
+        print('test_activation_page_activates_in_process-4')
+        # ---------- one query to load the user, one to activate it
+        with self.assertNumQueries(2):
+            response = self.client.get(self.activation_url)
+        self.assertContains(response, 'User newuser successfully activated')
+        self.new_user.refresh_from_db()
+        self.assertTrue(self.new_user.is_active)
+
+        # ---------- the token is not valid any more once the user is active
+        response = self.client.get(self.activation_url)
+        self.assertContains(response, 'Invalid activation Token')
+
+
+class HotIdeasRefreshTest(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user(username='author', email='author@example.com',
+                                                     password='Testpassword123', is_active=True)
+        self.old_idea = Idea.objects.create(i_title='Old', i_text='Text', author=self.author, overall_likes=100,
+                                            date_published=timezone.now() - timedelta(days=3))
+        self.new_idea = Idea.objects.create(i_title='New', i_text='Text', author=self.author, overall_likes=1)
+
+    def test_refresh_is_incremental(self):
+        print('test_refresh_is_incremental-5')
+        self.assertEqual(refresh_hot_ideas(), 2)
+        # ---------- three days of age outweigh a hundred times more votes
+        self.assertEqual(list(HotIdea.objects.order_by('-score').values_list('idea', flat=True)),
+                         [self.new_idea.pk, self.old_idea.pk])
+
+        Idea.objects.update(updated_at=timezone.now() - timedelta(minutes=10))
+        HotIdea.objects.update(refreshed_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(refresh_hot_ideas(overlap_seconds=0), 0)
+
+        # ---------- only the voted idea is refreshed
+        apply_votes([(self.old_idea.pk, self.author.pk, {'is_unlike': True})])
+        self.assertEqual(refresh_hot_ideas(overlap_seconds=0), 1)
+        self.assertEqual(refresh_hot_ideas(full=True), 2)
+
+
+class LikesConversionTest(TransactionTestCase):
+    def test_flags_are_converted_to_votes(self):
+        print('test_flags_are_converted_to_votes-6')
+        author = CustomUser.objects.create_user(username='author', email='author@example.com',
+                                                password='Testpassword123', is_active=True)
+        idea = Idea.objects.create(i_title='Idea', i_text='Text', author=author)
+        voters = [CustomUser.objects.create_user(username='voter{}'.format(number),
+                                                 email='voter{}@example.com'.format(number)) for number in range(5)]
+        # ---------- the table as it was before the vote column
+        table = connection.ops.quote_name(Likes._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE {} DROP COLUMN vote'.format(table))
+            cursor.execute('ALTER TABLE {} ADD COLUMN is_like bool NULL'.format(table))
+            cursor.execute('ALTER TABLE {} ADD COLUMN is_unlike bool NULL'.format(table))
+            flags = [(True, False), (False, True), (False, False), (None, None), (True, True)]
+            for voter, (is_like, is_unlike) in zip(voters, flags):
+                cursor.execute('INSERT INTO {} (parent_idea_id, user_id, is_like, is_unlike) VALUES (%s, %s, %s, %s)'
+                               .format(table), [idea.pk, voter.pk, is_like, is_unlike])
+
+        out = StringIO()
+        call_command('convert_likes_votes', '--chunk-size', '2', stdout=out)
+        self.assertIn('5 like(s) converted', out.getvalue())
+        self.assertIn('1 like(s) had both flags', out.getvalue())
+        self.assertEqual([vote for _, vote in Likes.objects.order_by('user').values_list('user', 'vote')],
+                         [Likes.LIKE, Likes.UNLIKE, Likes.NO_VOTE, Likes.NO_VOTE, Likes.LIKE])
+        with connection.cursor() as cursor:
+            columns = {column.name for column in connection.introspection.get_table_description(
+                cursor, Likes._meta.db_table)}
+        self.assertNotIn('is_like', columns)
+
+        out = StringIO()
+        call_command('convert_likes_votes', stdout=out)
+        self.assertIn('0 like(s) converted', out.getvalue())
+
+
+class LikesDedupeTest(TransactionTestCase):
+    def test_duplicate_votes_are_deduped(self):
+        print('test_duplicate_votes_are_deduped-7')
+        author = CustomUser.objects.create_user(username='author', email='author@example.com',
+                                                password='Testpassword123', is_active=True)
+        voter = CustomUser.objects.create_user(username='voter', email='voter@example.com')
+        idea = Idea.objects.create(i_title='Idea', i_text='Text', author=author)
+        constraint = Likes._meta.constraints[0]
+        # ---------- the table as it was before the constraint, SQLite rebuilds it from the given model
+        state = ProjectState.from_apps(apps)
+        state.models['ideas_place', 'likes'].options['constraints'] = []
+        with connection.schema_editor() as schema_editor:
+            schema_editor.remove_constraint(state.apps.get_model('ideas_place', 'Likes'), constraint)
+        try:
+            for vote in (Likes.UNLIKE, Likes.UNLIKE, Likes.LIKE):
+                Likes.objects.create(parent_idea=idea, user=voter, vote=vote)
+            Likes.objects.create(parent_idea=idea, user=author, vote=Likes.UNLIKE)
+            Likes.objects.create(parent_idea=idea, user=None, vote=Likes.UNLIKE)
+            Likes.objects.create(parent_idea=idea, user=None, vote=Likes.UNLIKE)
+            Idea.objects.filter(pk=idea.pk).update(overall_likes=1, overall_unlikes=5)
+
+            out = StringIO()
+            call_command('dedupe_likes', stdout=out)
+            self.assertIn('2 duplicate like(s) deleted', out.getvalue())
+            self.assertIn('1 idea(s) repaired', out.getvalue())
+            self.assertEqual(Likes.objects.get(parent_idea=idea, user=voter).vote, Likes.LIKE)
+            self.assertEqual(Likes.objects.filter(user=None).count(), 2)
+            idea.refresh_from_db()
+            self.assertEqual((idea.overall_likes, idea.overall_unlikes), (1, 3))
+        finally:
+            Likes.objects.all().delete()
+            with connection.schema_editor() as schema_editor:
+                schema_editor.add_constraint(Likes, constraint)
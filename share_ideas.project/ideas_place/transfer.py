@@ -0,0 +1,83 @@
+import json
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.utils.dateparse import parse_datetime
+
+from users.models import CustomUser
+from .models import Idea
+from .sharding import is_sharded
+from .signals import ideas_bulk_created
+
+# -------- NDJSON export and import of ideas -------------------
+# One JSON object per line: {"id", "i_title", "i_text", "author", "date_published"},
+# the author is referenced by username. Both directions work chunk by chunk,
+# so memory use doesn't depend on the number of ideas.
+
+EXPORT_FIELDS = ('pk', 'i_title', 'i_text', 'author__username', 'date_published')
+
+
+def export_lines(chunk_size=2000):
+    rows = Idea.objects.order_by('pk').values_list(*EXPORT_FIELDS)
+    for pk, i_title, i_text, author, date_published in rows.iterator(chunk_size=chunk_size):
+        yield json.dumps({'id': pk, 'i_title': i_title, 'i_text': i_text, 'author': author,
+                          'date_published': date_published.isoformat()}, ensure_ascii=False) + '\n'
+
+
+class IdeasImportError(ValueError):
+    pass
+
+
+def _parse_line(number, line):
+    try:
+        data = json.loads(line)
+        date_published = parse_datetime(data['date_published'])
+        if date_published is None:
+            raise ValueError('wrong date_published')
+        return {'id': data.get('id'), 'i_title': data['i_title'], 'i_text': data['i_text'],
+                'author': data.get('author'), 'date_published': date_published}
+    except (ValueError, KeyError, TypeError) as e:
+        raise IdeasImportError('Line {}: {}'.format(number, e))
+
+
+def import_lines(lines, chunk_size=1000, keep_ids=False):
+    """
+    Create ideas from NDJSON lines with one bulk_create per chunk, authors are
+    resolved with one query per chunk. Return (created, unknown_authors) counters.
+    """
+    if is_sharded():
+        # ---------- bulk_create would bypass the shard placement and the ids allocation
+        raise IdeasImportError('The import does not support IDEA_SHARDS')
+    using = router.db_for_write(Idea)
+    numbered = ((number, line) for number, line in enumerate(lines, start=1) if line.strip())
+    created = unknown_authors = 0
+
+    while True:
+        chunk = [_parse_line(number, line) for number, line in islice(numbered, chunk_size)]
+        if not chunk:
+            break
+
+        usernames = {row['author'] for row in chunk if row['author'] is not None}
+        authors = dict(CustomUser.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        ideas = []
+        for row in chunk:
+            author_id = authors.get(row['author'])
+            if author_id is None and row['author'] is not None:
+                unknown_authors += 1
+            ideas.append(Idea(pk=row['id'] if keep_ids else None, i_title=row['i_title'], i_text=row['i_text'],
+                              author_id=author_id, date_published=row['date_published']))
+
+        with transaction.atomic(using=using):
+            ideas = Idea.objects.using(using).bulk_create(ideas)
+            ideas_bulk_created.send(sender=Idea, ideas=ideas, using=using)
+        created += len(ideas)
+
+    if keep_ids and created:
+        # ---------- explicit ids leave the PostgreSQL sequence behind
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Idea]):
+                cursor.execute(sql)
+
+    return created, unknown_authors
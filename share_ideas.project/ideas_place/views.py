@@ -1,8 +1,6 @@
-from django.urls import reverse
 from django.views.generic import TemplateView
-from django.contrib.sites.shortcuts import get_current_site
-import requests
-import json
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_api.services import activate_user
 
 
 # Create your views here.
@@ -27,10 +25,11 @@ class UserActivation(TemplateView):
         Return result message. Success - user mail was confirmed and users 'is_active'
         has become True, detail: - in the other case, which means user activation failed.
         """
-        url = 'http://' + get_current_site(self.request).domain + reverse('rest_api:user-activate')
-        data = {'activation': {"uid": uidb64, 'token': token}}
-        headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-        rq = requests.post(url, data=json.dumps(data), headers=headers)
-        message = rq.json().get('success', None)
+        try:
+            user = activate_user({"uid": uidb64, 'token': token})
+        except PermissionDenied as e:
+            return e.detail
+        except ValidationError as e:
+            return ' '.join(str(error) for errors in e.detail.values() for error in errors)
 
-        return message if message is not None else rq.json().get('detail', None)
+        return 'User {} successfully activated'.format(user.username)
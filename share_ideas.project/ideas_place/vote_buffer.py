@@ -0,0 +1,124 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+
+from rest_api.sqlite import run_write
+from .votes import apply_votes, normalize_vote_changes
+
+logger = logging.getLogger(__name__)
+
+# -------- Write-behind votes -------------------
+# With VOTE_BUFFER the single votes of AddLikes are kept in the memory of the worker process,
+# coalesced by (idea, user) with the last write winning, and saved with apply_votes() every
+# VOTE_BUFFER_FLUSH_MS, or as soon as VOTE_BUFFER_MAX_EVENTS votes are waiting. A viral idea
+# gets one counters UPDATE per flush instead of one per vote.
+# The voter sees the own vote at once in the idea detail of the same process, the other
+# processes and the counters seen by the other users follow after the flush.
+# The buffer is flushed at the exit of the process (a graceful worker shutdown); a killed
+# process loses its unflushed votes. With SQLITE_WRITE_QUEUE the flush is one more write of the
+# writer thread (see rest_api.sqlite).
+
+
+def is_vote_buffer_enabled():
+    return getattr(settings, 'VOTE_BUFFER', False)
+
+
+class VoteBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._pending = {}
+        # ---------- the votes being saved, still "pending" for the readers until the commit
+        self._flushing = {}
+        self._events = 0
+
+    def add(self, idea_id, user_id, changes):
+        if user_id is None:
+            raise ValueError('Vote without a user cannot be saved')
+        with self._lock:
+            if self._pid != os.getpid():
+                # ---------- a forked worker owns neither the parent's votes nor its flush thread
+                self._pid = os.getpid()
+                self._pending = {}
+                self._events = 0
+                threading.Thread(target=self._run, name='vote-buffer', daemon=True).start()
+            self._pending.setdefault((idea_id, user_id), {}).update(normalize_vote_changes(changes))
+            self._events += 1
+            if self._events >= getattr(settings, 'VOTE_BUFFER_MAX_EVENTS', 500):
+                self._wakeup.set()
+
+    def pending_vote(self, idea_id, user_id):
+        """
+        Return the unflushed changes of the user's vote for the idea, None without any.
+        """
+        if self._pid != os.getpid():
+            return None
+        key = (idea_id, user_id)
+        with self._lock:
+            if key not in self._pending and key not in self._flushing:
+                return None
+            changes = dict(self._flushing.get(key, {}))
+            changes.update(self._pending.get(key, {}))
+            return changes
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(getattr(settings, 'VOTE_BUFFER_FLUSH_MS', 200) / 1000)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Votes flush failed, retrying with the next flush')
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """
+        Save the waiting votes, put the unsaved ones back in front of the newer ones if the save fails.
+        """
+        if self._pid != os.getpid():
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._events = self._pending, {}, 0
+                self._flushing = pending
+            flushed = len(pending)
+            if not flushed:
+                return 0
+            try:
+                self._save(pending)
+            except Exception:
+                with self._lock:
+                    for key, changes in self._pending.items():
+                        pending.setdefault(key, {}).update(changes)
+                    self._pending, self._flushing = pending, {}
+                raise
+            with self._lock:
+                self._flushing = {}
+            return flushed
+
+    @staticmethod
+    def _save(pending):
+        try:
+            run_write(apply_votes, [(idea_id, user_id, changes) for (idea_id, user_id), changes in pending.items()])
+            return
+        except IntegrityError:
+            pass
+        # ---------- e.g. an idea deleted after the vote, save one by one and drop the failing votes
+        for key, changes in list(pending.items()):
+            try:
+                run_write(apply_votes, [key + (changes,)])
+            except IntegrityError as e:
+                logger.warning('Vote %s dropped: %s', key, e)
+            # ---------- what is left in pending is put back by flush() if another error stops the loop
+            del pending[key]
+
+
+vote_buffer = VoteBuffer()
+atexit.register(vote_buffer.flush)
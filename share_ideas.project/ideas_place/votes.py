@@ -0,0 +1,126 @@
+from django.db import connections, router, transaction
+
+from .models import Idea, Likes
+from .sharding import shard_for_idea
+
+
+def normalize_vote_changes(changes):
+    """
+    Return the 'is_like'/'is_unlike' changes with a like clearing the unlike and the other way
+    round, so that changes merged with dict.update() give the vote of applying them in turn.
+    """
+    changes = {key: bool(value) for key, value in changes.items() if key in ('is_like', 'is_unlike')}
+    if changes.get('is_like'):
+        changes['is_unlike'] = False
+    elif changes.get('is_unlike'):
+        changes['is_like'] = False
+    return changes
+
+
+def apply_vote_changes(vote, changes):
+    """
+    Return the vote (Likes.LIKE, NO_VOTE or UNLIKE) after the normalized changes.
+    """
+    if changes.get('is_like', vote == Likes.LIKE):
+        return Likes.LIKE
+    if changes.get('is_unlike', vote == Likes.UNLIKE):
+        return Likes.UNLIKE
+    return Likes.NO_VOTE
+
+
+def vote_flags(vote):
+    return vote == Likes.LIKE, vote == Likes.UNLIKE
+
+
+def _supports_upsert(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        # ---------- INSERT ... ON CONFLICT DO UPDATE appeared in SQLite 3.24
+        return connection.Database.sqlite_version_info >= (3, 24, 0)
+    return False
+
+
+def _upsert_likes(connection, rows):
+    """
+    Write all (parent_idea_id, user_id, vote) rows with one
+    INSERT ... ON CONFLICT DO UPDATE statement.
+    """
+    quote = connection.ops.quote_name
+    meta = Likes._meta
+    columns = [meta.get_field(name).column for name in ('parent_idea', 'user', 'vote')]
+    sql = 'INSERT INTO {table} ({columns}) VALUES {values} ON CONFLICT ({idea}, {user}) DO UPDATE SET ' \
+          '{vote} = excluded.{vote}'.format(
+            table=quote(meta.db_table),
+            columns=', '.join(quote(column) for column in columns),
+            values=', '.join(['(%s, %s, %s)'] * len(rows)),
+            idea=quote(columns[0]), user=quote(columns[1]), vote=quote(columns[2]))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def apply_votes(votes):
+    """
+    Save users' votes and shift the ideas' likes counters in one transaction
+    (one per shard when the ideas are sharded, see ideas_place.sharding).
+
+    ``votes`` is an iterable of (idea_id, user_id, changes) where ``changes``
+    may hold 'is_like' and/or 'is_unlike'; omitted flags keep their stored value,
+    a like clears the unlike and the other way round.
+    Several votes for the same (idea, user) are coalesced, the last one wins.
+    Returns a dict {(idea_id, user_id): vote} with the saved Likes.vote.
+    """
+    pending = {}
+    for idea_id, user_id, changes in votes:
+        if user_id is None:
+            raise ValueError('Vote without a user cannot be saved')
+        pending.setdefault((idea_id, user_id), {}).update(normalize_vote_changes(changes))
+    if not pending:
+        return {}
+
+    by_shard = {}
+    for key, changes in pending.items():
+        by_shard.setdefault(shard_for_idea(key[0]), {})[key] = changes
+    saved = {}
+    for using, shard_pending in by_shard.items():
+        saved.update(_apply_shard_votes(using or router.db_for_write(Likes), shard_pending))
+    return saved
+
+
+def _apply_shard_votes(using, pending):
+    connection = connections[using]
+    idea_ids = {idea_id for idea_id, _ in pending}
+    user_ids = {user_id for _, user_id in pending}
+
+    with transaction.atomic(using=using):
+        if connection.features.has_select_for_update:
+            # ---------- a first vote has no Likes row to lock yet, the ideas' rows serialize the
+            # concurrent votes for them, in pk order against deadlocks. SQLite writers are serialized anyway
+            list(Idea.objects.using(using).select_for_update().filter(pk__in=idea_ids)
+                 .order_by('pk').values_list('pk', flat=True))
+        # ---------- previous state is needed for the counters delta, lock it until commit
+        stored = Likes.objects.using(using).select_for_update().filter(
+            parent_idea__in=idea_ids, user__in=user_ids).values_list('parent_idea', 'user', 'vote')
+        previous = {(idea_id, user_id): vote for idea_id, user_id, vote in stored}
+
+        saved = {}
+        deltas = {}
+        for key, changes in pending.items():
+            was_vote = previous.get(key, Likes.NO_VOTE)
+            vote = apply_vote_changes(was_vote, changes)
+            saved[key] = vote
+
+            likes, unlikes = deltas.get(key[0], (0, 0))
+            deltas[key[0]] = (likes + (vote == Likes.LIKE) - (was_vote == Likes.LIKE),
+                              unlikes + (vote == Likes.UNLIKE) - (was_vote == Likes.UNLIKE))
+
+        if _supports_upsert(connection):
+            _upsert_likes(connection, [key + (vote,) for key, vote in saved.items()])
+        else:
+            for (idea_id, user_id), vote in saved.items():
+                Likes.objects.using(using).update_or_create(
+                    parent_idea_id=idea_id, user_id=user_id, defaults={'vote': vote})
+
+        Idea.objects.using(using).shift_likes_counters(deltas)
+
+    return saved
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class RestApiConfig(AppConfig):
     name = 'rest_api'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .sqlite import apply_pragmas
+        connection_created.connect(apply_pragmas, dispatch_uid='rest_api_sqlite_pragmas')
@@ -0,0 +1,295 @@
+"""
+Native ASGI handlers of the read endpoints (ideas list, idea detail, user detail).
+
+Django 3.0 has neither async views nor an async ORM, so the handlers are coroutines
+which do the JWT check, conditional GET and JSON rendering on the event loop and send
+only the database work to a bounded thread pool. The querysets, serializers and
+validators are the ones of the sync views in rest_api.views.
+Only the requests negotiated to JSON come here, the browsable API stays with the sync views.
+Of the middleware chain, the timing, metrics and primary pinning are done by AsyncReadHandler,
+the security, common and clickjacking middlewares run their request/response hooks around the handlers.
+"""
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import response_for_exception
+from django.db import close_old_connections, connections
+from django.http import Http404, HttpRequest, HttpResponse, QueryDict
+from django.urls import Resolver404, get_resolver, set_urlconf
+from django.utils.cache import cc_delim_re, patch_vary_headers
+from django.utils.module_loading import import_string
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import APIView, exception_handler
+
+from .authentication import CachedJWTAuthentication, token_user_id
+from .cache import get_ideas_list
+from .conditional import not_modified_response, set_validators
+from .db_router import is_user_pinned, use_primary
+from .metrics import registry
+from .middleware import RequestTimings, log_request_timings
+from .views import IdeaTools, UserDetail
+
+_db_pool = None
+# ---------- RequestTimings of the current request with REQUEST_TIMING, the pool calls count their queries in it
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_DB_POOL_SIZE', 8),
+                                      thread_name_prefix='async-db')
+    return _db_pool
+
+
+def _with_fresh_connections(func, *args, **kwargs):
+    # ---------- pool threads keep their connections between calls, as request threads do
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            timings = _request_timings.get()
+            if timings is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_db_pool(func, *args, **kwargs):
+    """
+    Run a sync database call in the pool without blocking the event loop.
+    """
+    call = functools.partial(_with_fresh_connections, func, *args, **kwargs)
+    context = contextvars.copy_context()
+    return await asyncio.get_event_loop().run_in_executor(_get_db_pool(), context.run, call)
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+    for header, value in (headers or {}).items():
+        response[header] = value
+    return response
+
+
+def get_validated_token(request):
+    """
+    Validate the request's access token on the loop, nothing of it needs the database.
+    """
+    authenticator = CachedJWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise exceptions.NotAuthenticated()
+    return authenticator, authenticator.get_validated_token(raw_token)
+
+
+def load_view(view_class, request, authenticator, validated_token):
+    drf_request = Request(request)
+    drf_request.user = authenticator.get_user(validated_token)
+    return view_class(request=drf_request)
+
+
+# ---------- each handler hops to the database pool once, for the user and the data together
+
+async def idea_list(request, format=None):
+    token = get_validated_token(request)
+
+    def load():
+        view = load_view(IdeaTools, request, *token)
+        return get_ideas_list(view.request, view.get_ideas_list_data)
+
+    data, hit = await run_in_db_pool(load)
+    return json_response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+
+async def idea_detail(request, pk, format=None):
+    token = get_validated_token(request)
+
+    def load():
+        view = load_view(IdeaTools, request, *token)
+        return view, view.get_object(pk)
+
+    view, idea = await run_in_db_pool(load)
+    etag = view.get_idea_etag(idea)
+    last_modified = view.get_idea_last_modified(idea)
+    not_modified = not_modified_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    # ---------- the idea is fully annotated, serialization doesn't touch the database
+    return set_validators(json_response(view.get_idea_data(idea)), etag=etag, last_modified=last_modified)
+
+
+async def user_detail(request, pk, format=None):
+    token = get_validated_token(request)
+
+    def load():
+        view = load_view(UserDetail, request, *token)
+        author = view.get_object(pk)
+        etag = view.get_etag(author)
+        if not_modified_response(request, etag=etag) is not None:
+            return etag, None
+        return etag, view.get_author_data(author)
+
+    etag, data = await run_in_db_pool(load)
+    if data is None:
+        return not_modified_response(request, etag=etag)
+    return set_validators(json_response(data), etag=etag)
+
+
+ASYNC_READ_VIEWS = {
+    'rest_api:idea-tool': idea_list,
+    'rest_api:idea-detail': idea_detail,
+    'rest_api:user-detail': user_detail,
+}
+
+
+def negotiates_json(scope, format_suffix=None):
+    """
+    Whether the content negotiation of the sync views picks the JSON renderer for the request.
+    """
+    request = HttpRequest()
+    query_string = scope.get('query_string', b'')
+    request.GET = QueryDict(query_string.decode('latin-1') if isinstance(query_string, bytes) else query_string)
+    for name, value in scope.get('headers', ()):
+        if name.lower() == b'accept':
+            request.META['HTTP_ACCEPT'] = value.decode('latin-1')
+    negotiator = APIView.settings.DEFAULT_CONTENT_NEGOTIATION_CLASS()
+    try:
+        renderer, _ = negotiator.select_renderer(Request(request), [renderer() for renderer in
+                                                                    APIView.renderer_classes], format_suffix)
+    except (exceptions.NotAcceptable, Http404):
+        # ---------- the sync views answer with the error in the right shape
+        return False
+    return isinstance(renderer, JSONRenderer)
+
+
+def resolve_async_view(scope):
+    """
+    Return (handler, match) for the GET/HEAD requests of the read endpoints negotiated
+    to JSON, (None, None) otherwise.
+    """
+    if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+        return None, None
+    path = scope['path']
+    root_path = scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    try:
+        match = get_resolver().resolve(path)
+    except Resolver404:
+        return None, None
+    handler = ASYNC_READ_VIEWS.get(match.view_name)
+    if handler is None or not negotiates_json(scope, match.kwargs.get('format')):
+        return None, None
+    return handler, match
+
+
+# ---------- middlewares of MIDDLEWARE whose hooks don't need the view, run around the async handlers
+HOOK_MIDDLEWARE = (
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+)
+
+
+class AsyncReadHandler(ASGIHandler):
+    """
+    ASGIHandler which awaits the async read views instead of running
+    the sync middleware/view chain in a thread.
+    """
+    def load_middleware(self):
+        super().load_middleware()
+        self.hook_middleware = [import_string(path)() for path in settings.MIDDLEWARE if path in HOOK_MIDDLEWARE]
+
+    async def get_response(self, request):
+        started = time.perf_counter()
+        set_urlconf(settings.ROOT_URLCONF)
+        handler, match = resolve_async_view(request.scope)
+        request.resolver_match = match
+        # ---------- the middleware chain is skipped here, so time and count the request as
+        # RequestTimingMiddleware and MetricsMiddleware do
+        timings = RequestTimings() if getattr(settings, 'REQUEST_TIMING', False) else None
+        timings_token = _request_timings.set(timings)
+        try:
+            response = await self.get_view_response(request, handler, match, timings)
+        finally:
+            _request_timings.reset(timings_token)
+        for middleware in reversed(self.hook_middleware):
+            if hasattr(middleware, 'process_response'):
+                response = middleware.process_response(request, response)
+        if timings is not None:
+            log_request_timings(request, response, timings, getattr(settings, 'REQUEST_TIMING_HEADER', False))
+        if getattr(settings, 'METRICS', False):
+            registry.observe(match.view_name, response.status_code, time.perf_counter() - started)
+        response._closable_objects.append(request)
+        return response
+
+    async def get_view_response(self, request, handler, match, timings):
+        try:
+            for middleware in self.hook_middleware:
+                response = middleware.process_request(request) if hasattr(middleware, 'process_request') else None
+                if response is not None:
+                    return response
+            if timings is not None:
+                timings.view_started = time.perf_counter()
+            try:
+                # ---------- as PrimaryPinningMiddleware does, the pool calls run in a copy of this context
+                pinned = bool(getattr(settings, 'DATABASE_REPLICAS', None)) and is_user_pinned(token_user_id(request))
+                with use_primary(pinned):
+                    response = await handler(request, *match.args, **match.kwargs)
+            except (exceptions.APIException, Http404) as exc:
+                response = self.api_exception_response(exc)
+            if timings is not None:
+                timings.view_finished = time.perf_counter()
+            self.set_view_headers(request, match, response)
+            return response
+        except Exception as exc:
+            return response_for_exception(request, exc)
+
+    @staticmethod
+    def set_view_headers(request, match, response):
+        # ---------- Allow and Vary, as APIView.finalize_response() sets them
+        view = match.func.view_class(**match.func.view_initkwargs)
+        view.setup(request, *match.args, **match.kwargs)
+        # ---------- View.as_view() answers HEAD with get() too
+        view.head = view.get
+        headers = view.default_response_headers
+        vary = headers.pop('Vary', None)
+        if vary is not None:
+            patch_vary_headers(response, cc_delim_re.split(vary))
+        for header, value in headers.items():
+            response[header] = value
+
+    @staticmethod
+    def api_exception_response(exc):
+        drf_response = exception_handler(exc, {})
+        headers = {}
+        if isinstance(exc, exceptions.NotAuthenticated) or getattr(exc, 'status_code', None) == 401:
+            headers['WWW-Authenticate'] = CachedJWTAuthentication().authenticate_header(None)
+        return json_response(drf_response.data, status_code=drf_response.status_code, headers=headers)
+
+
+class AsyncReadRouter:
+    """
+    ASGI application serving the read endpoints with AsyncReadHandler
+    and everything else with the regular Django application.
+    """
+    def __init__(self, application):
+        self.application = application
+        self.read_handler = AsyncReadHandler()
+
+    async def __call__(self, scope, receive, send):
+        handler, _ = resolve_async_view(scope) if scope['type'] == 'http' else (None, None)
+        if handler is not None:
+            await self.read_handler(scope, receive, send)
+        else:
+            await self.application(scope, receive, send)
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import AUTH_FIELDS
+from .db_router import use_primary
+
+# -------- Cached user resolution of the JWT authentication -------------------
+# The id and the AUTH_FIELDS flags of the authenticated user are kept in the JWT_USER_CACHE_ALIAS
+# cache, never the password hash or the personal data. The request gets a user with the other
+# fields deferred, loaded on their first use. TIMEOUT and MAX_ENTRIES bound how stale and how big
+# the cache can get. Saving or deleting a user, and a queryset update() of AUTH_FIELDS, drop its
+# entry (see rest_api.signals). With a per process cache (locmem) the other processes keep their
+# copy until it expires, so keep the TIMEOUT short.
+
+CACHED_USER_FIELDS = ('id',) + AUTH_FIELDS
+
+
+def _cache():
+    return caches[getattr(settings, 'JWT_USER_CACHE_ALIAS', 'default')]
+
+
+def user_cache_key(user_id):
+    return 'jwt:user:{}'.format(user_id)
+
+
+def invalidate_cached_user(user_id):
+    _cache().delete(user_cache_key(user_id))
+
+
+def token_user_id(request):
+    """
+    Return the user id of the request's valid access token, None without one.
+    """
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    try:
+        return authenticator.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+    except (InvalidToken, TokenError):
+        return None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication which loads the token's user from the database on a cache miss only.
+    Missing and inactive users are never cached, they fail the authentication as usual.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cache = _cache()
+        key = user_cache_key(user_id)
+        values = cache.get(key)
+        if values is None:
+            # ---------- a replica may not have the change which has just dropped the cached user
+            with use_primary():
+                user = super().get_user(validated_token)
+            cache.set(key, [getattr(user, name) for name in CACHED_USER_FIELDS])
+            return user
+        user_model = get_user_model()
+        return user_model.from_db(router.db_for_read(user_model), CACHED_USER_FIELDS, values)
@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .db_router import replica_may_lag
+
+# -------- Versioned cache of the ideas list pages -------------------
+# Every cached page key contains the current "ideas version". Any Idea change bumps
+# the version (see rest_api.signals), so all the cached pages become unreachable at once
+# and expire by themselves, nothing has to be deleted key by key.
+
+IDEAS_VERSION_KEY = 'ideas:version'
+IDEAS_CHANGED_AT_KEY = 'ideas:changed_at'
+IDEAS_HITS_KEY = 'ideas:list:hits'
+IDEAS_MISSES_KEY = 'ideas:list:misses'
+
+
+def _cache():
+    return caches[getattr(settings, 'IDEAS_LIST_CACHE_ALIAS', 'default')]
+
+
+def _incr(cache, key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # ---------- missing key, a concurrent add() may win, then retry the increment
+        if not cache.add(key, 1, timeout=None):
+            return cache.incr(key)
+        return 1
+
+
+def get_ideas_version():
+    cache = _cache()
+    version = cache.get(IDEAS_VERSION_KEY)
+    if version is None:
+        # ---------- start from the clock, so a lost version never reuses the keys of old pages
+        cache.add(IDEAS_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(IDEAS_VERSION_KEY)
+    return version
+
+
+def bump_ideas_version():
+    cache = _cache()
+    cache.set(IDEAS_CHANGED_AT_KEY, time.time(), timeout=None)
+    try:
+        cache.incr(IDEAS_VERSION_KEY)
+    except ValueError:
+        get_ideas_version()
+
+
+def ideas_list_key(request):
+    url_hash = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return 'ideas:list:{}:{}'.format(get_ideas_version(), url_hash)
+
+
+def get_ideas_list(request, build_data):
+    """
+    Return (data, hit) for the ideas list page of the request,
+    build_data() is called to render the page on a cache miss.
+    """
+    cache = _cache()
+    key = ideas_list_key(request)
+    data = cache.get(key)
+    if data is not None:
+        _incr(cache, IDEAS_HITS_KEY)
+        return data, True
+
+    _incr(cache, IDEAS_MISSES_KEY)
+    data = build_data()
+    # ---------- a page read from a lagging replica would outlive the change under the new version
+    if not replica_may_lag(cache.get(IDEAS_CHANGED_AT_KEY)):
+        cache.set(key, data, getattr(settings, 'IDEAS_LIST_CACHE_TIMEOUT', 300))
+    return data, False
+
+
+def ideas_list_cache_stats():
+    cache = _cache()
+    hits = cache.get(IDEAS_HITS_KEY) or 0
+    misses = cache.get(IDEAS_MISSES_KEY) or 0
+    requests_count = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / requests_count if requests_count else 0.0}
@@ -0,0 +1,32 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    Strong ETag built from the values the representation depends on.
+    """
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return '"{}"'.format(digest)
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified_response(request, etag=None, last_modified=None):
+    """
+    Return a 304 response when If-None-Match/If-Modified-Since of the request
+    match the given validators, None when the full response must be built.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified is not None else None)
+    if response is None:
+        return None
+    return set_validators(response, etag=etag, last_modified=last_modified)
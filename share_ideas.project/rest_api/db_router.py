@@ -0,0 +1,90 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# -------- Primary/replicas routing -------------------
+# Writes go to the primary ('default'), reads to a random DATABASE_REPLICAS alias, unless
+# - the current request is pinned to the primary (see rest_api.middleware.PrimaryPinningMiddleware):
+#   writes, and reads of a user who has written in the last REPLICA_PIN_SECONDS,
+# - a transaction is open on the primary, its reads must see its own writes and locks.
+
+_use_primary = ContextVar('use_primary', default=False)
+
+# ---------- cache backends whose entries the other worker processes don't see
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def _pins_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+
+def check_pins_cache():
+    """
+    Raise ImproperlyConfigured when the pins would stay in the worker process which set them,
+    the next request of the user mostly reaches another one.
+    """
+    alias = getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None or backend in PROCESS_LOCAL_CACHE_BACKENDS:
+        raise ImproperlyConfigured('DATABASE_REPLICAS needs REPLICA_PIN_CACHE_ALIAS to be a cache shared by '
+                                   'all the workers (e.g. memcached or redis), {!r} is {}'.format(alias, backend))
+
+
+def _pin_key(user_id):
+    return 'db:pin:user:{}'.format(user_id)
+
+
+@contextmanager
+def use_primary(enabled=True):
+    token = _use_primary.set(enabled)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def pin_user_to_primary(user_id):
+    _pins_cache().set(_pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def is_user_pinned(user_id):
+    return user_id is not None and bool(_replicas()) and bool(_pins_cache().get(_pin_key(user_id)))
+
+
+def replica_may_lag(since):
+    """
+    True if a replica read made now may miss a write made at `since` (time.time()).
+    """
+    return bool(_replicas()) and not _use_primary.get() and \
+        since is not None and time.time() - since < getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = _replicas()
+        if not replicas or _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # ---------- replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -1,4 +1,7 @@
-from django.core.mail import EmailMessage
+from datetime import timedelta
+from django.core.mail import get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.contrib.sites.shortcuts import get_current_site
 from django.template.loader import render_to_string
@@ -6,6 +9,8 @@ from django.utils.encoding import force_bytes, force_text
 
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 
+from .models import OutgoingMail
+
 
 class AccountActivationTokenGenerator(PasswordResetTokenGenerator):
     def _make_hash_value(self, user, timestamp):
@@ -28,7 +33,79 @@ def mail_confirmation(user_=None, request=None):
         'token': account_activation_token.make_token(user_),
     })
     mail_subject = 'Your Mail confirmation message'
-    email = EmailMessage(mail_subject, message, to=[user_.email])
-    email.send()
-    return
+    return queue_mail(mail_subject, message, to=[user_.email])
+
+
+# -------- Mail outbox -------------------
+
+
+def queue_mail(subject, body, to, from_email=''):
+    """
+    Store a rendered mail in the outbox, the `send_outbox` worker delivers it.
+    """
+    return OutgoingMail.objects.create(subject=subject, body=body, to='\n'.join(to), from_email=from_email)
+
+
+def send_outbox(batch_size=100, max_attempts=5, backoff_seconds=60, max_backoff_seconds=3600, claim_seconds=300):
+    """
+    Send one batch of due outbox mails over a single mail backend connection.
+    Failed mails are retried later with exponential backoff until max_attempts.
+    Return (sent, failed) counters.
+    """
+    batch = _claim_outbox_batch(batch_size, max_attempts, claim_seconds)
+    if not batch:
+        return 0, 0
+
+    # ---------- no transaction is open while sending, the outbox inserts of the signups don't wait for SMTP
+    sent = failed = 0
+    mail_connection = get_connection(fail_silently=False)
+    try:
+        mail_connection.open()
+        connection_error = None
+    except Exception as e:
+        connection_error = e
+
+    try:
+        for mail in batch:
+            error = connection_error
+            if error is None:
+                try:
+                    mail.as_email_message(connection=mail_connection).send()
+                except Exception as e:
+                    error = e
+
+            if error is None:
+                mail.sent_at = timezone.now()
+                mail.last_error = ''
+                sent += 1
+            else:
+                mail.attempts += 1
+                delay = min(backoff_seconds * 2 ** (mail.attempts - 1), max_backoff_seconds)
+                mail.send_after = timezone.now() + timedelta(seconds=delay)
+                mail.last_error = '{}: {}'.format(type(error).__name__, error)
+                failed += 1
+            with transaction.atomic():
+                mail.save(update_fields=['sent_at', 'attempts', 'send_after', 'last_error'])
+    finally:
+        if connection_error is None:
+            mail_connection.close()
+
+    return sent, failed
+
+
+def _claim_outbox_batch(batch_size, max_attempts, claim_seconds):
+    """
+    Take the due mails in a short transaction: their send_after moves claim_seconds ahead,
+    so the other workers skip them, and a worker which dies while sending leaves them to a retry.
+    """
+    now = timezone.now()
+    lock_options = {'skip_locked': True} if db_connection.features.has_select_for_update_skip_locked else {}
 
+    with transaction.atomic():
+        batch = list(OutgoingMail.objects.select_for_update(**lock_options).filter(
+            sent_at__isnull=True, attempts__lt=max_attempts, send_after__lte=now
+        ).order_by('send_after', 'pk')[:batch_size])
+        if batch:
+            OutgoingMail.objects.filter(pk__in=[mail.pk for mail in batch]).update(
+                send_after=now + timedelta(seconds=claim_seconds))
+    return batch
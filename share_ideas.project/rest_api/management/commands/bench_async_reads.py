@@ -0,0 +1,72 @@
+import asyncio
+import statistics
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from rest_api.async_views import AsyncReadRouter
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Compare the sync and the async ASGI handling of a read endpoint, in process."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/v1/ideas/', help="Endpoint to request.")
+        parser.add_argument('--username', required=True, help="User the access token is issued for.")
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['username'])
+        except CustomUser.DoesNotExist:
+            raise CommandError('Unknown user {}'.format(options['username']))
+        token = str(AccessToken.for_user(user))
+
+        sync_app = get_asgi_application()
+        for name, app in (('sync', sync_app), ('async', AsyncReadRouter(sync_app))):
+            latencies, statuses, elapsed = asyncio.run(self.run_app(app, token, **options))
+            latencies.sort()
+            self.stdout.write('{:>5}: {} requests in {:.2f}s, {:.0f} req/s, p50 {:.1f}ms, p95 {:.1f}ms, '
+                              'statuses {}'.format(name, len(latencies), elapsed, len(latencies) / elapsed,
+                                                   statistics.median(latencies) * 1000,
+                                                   latencies[int(len(latencies) * 0.95) - 1] * 1000,
+                                                   sorted(statuses)))
+
+    async def run_app(self, app, token, path, requests, concurrency, **options):
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, statuses = [], set()
+
+        async def one_request():
+            async with semaphore:
+                started = time.perf_counter()
+                status = await self.call(app, path, token)
+                latencies.append(time.perf_counter() - started)
+                statuses.add(status)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(requests)))
+        return latencies, statuses, time.perf_counter() - started
+
+    @staticmethod
+    async def call(app, path, token):
+        path, _, query_string = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'authorization', 'Bearer {}'.format(token).encode())],
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await app(scope, receive, send)
+        return messages[0]['status']
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ideas_place.models import Idea
+from rest_api.serializers import IdeasListFastSerializer, IdeasListSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare IdeasListSerializer and IdeasListFastSerializer on in-memory rows, no database needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3, help="Best of this many runs is reported.")
+
+    def handle(self, *args, **options):
+        rows_count = options['rows']
+        now = timezone.now()
+        rows = [{'id': number, 'i_title': 'Idea {}'.format(number), 'author': number % 50 or None,
+                 'date_published': now} for number in range(1, rows_count + 1)]
+        ideas = [Idea(id=row['id'], i_title=row['i_title'], author_id=row['author'],
+                      date_published=row['date_published']) for row in rows]
+        context = {'request': Request(APIRequestFactory().get(reverse('rest_api:idea-tool'), SERVER_NAME='localhost'))}
+
+        timings = {}
+        outputs = {}
+        for name, serialize in (
+                ('IdeasListSerializer', lambda: IdeasListSerializer(ideas, context=context, many=True).data),
+                ('IdeasListFastSerializer', lambda: IdeasListFastSerializer(rows, context=context).data)):
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                outputs[name] = JSONRenderer().render(serialize())
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+            self.stdout.write('{:>24}: {:.1f} ms per 10k rows'.format(name, best * 10000 / rows_count * 1000))
+
+        if outputs['IdeasListSerializer'] != outputs['IdeasListFastSerializer']:
+            raise CommandError('The serializers output differs')
+        self.stdout.write('Identical output, {:.1f}x faster'.format(
+            timings['IdeasListSerializer'] / timings['IdeasListFastSerializer']))
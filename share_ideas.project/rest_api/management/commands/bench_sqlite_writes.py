@@ -0,0 +1,110 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, router
+from django.test.utils import override_settings
+
+from ideas_place.models import Idea, Likes
+from ideas_place.sharding import is_sharded
+from ideas_place.votes import apply_votes
+from rest_api.sqlite import get_write_queue, run_write
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent vote writes on the SQLite database with the default pragmas, " \
+           "with SQLITE_PRAGMAS, and with SQLITE_PRAGMAS and the write queue. " \
+           "It runs on a temporary copy of the schema, the configured database is left untouched."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--votes', type=int, default=200, help="Votes per thread.")
+        parser.add_argument('--ideas', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Needs a SQLite database')
+        if is_sharded() or router.db_for_write(Likes) != DEFAULT_DB_ALIAS:
+            raise CommandError('Votes are not written to the default database, the benchmark would miss them')
+
+        with self.temporary_database():
+            self.run_scenarios(options)
+
+    @staticmethod
+    @contextmanager
+    def temporary_database():
+        """
+        Point 'default' to a new database file with the schema of the project, delete it afterwards.
+        """
+        directory = tempfile.mkdtemp(prefix='bench-sqlite-writes-')
+        settings_dict = connections.databases[DEFAULT_DB_ALIAS]
+        name = settings_dict['NAME']
+        connections.close_all()
+        settings_dict['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        try:
+            call_command('migrate', run_syncdb=True, interactive=False, verbosity=0)
+            yield
+        finally:
+            connections.close_all()
+            settings_dict['NAME'] = name
+            shutil.rmtree(directory)
+
+    def run_scenarios(self, options):
+        voters = [CustomUser.objects.create(username='bench-voter-{}'.format(number),
+                                            email='bench-voter-{}@example.com'.format(number))
+                  for number in range(options['threads'])]
+        idea_ids = [Idea.objects.create(i_title='Bench idea {}'.format(number)).pk
+                    for number in range(options['ideas'])]
+
+        scenarios = (
+            ('default pragmas', {'journal_mode': 'delete', 'synchronous': 'full'}, False),
+            ('SQLITE_PRAGMAS', settings.SQLITE_PRAGMAS, False),
+            ('SQLITE_PRAGMAS + queue', settings.SQLITE_PRAGMAS, True),
+        )
+        for name, pragmas, use_queue in scenarios:
+            # ---------- new connections get the scenario's pragmas
+            connections.close_all()
+            with override_settings(SQLITE_PRAGMAS=pragmas, SQLITE_WRITE_QUEUE=use_queue):
+                latencies, errors, elapsed = self.run_votes(voters, idea_ids, options['votes'])
+            latencies.sort()
+            batches = ''
+            if use_queue:
+                write_queue = get_write_queue()
+                batches = ', {:.1f} writes per transaction'.format(write_queue.writes / max(write_queue.batches, 1))
+            self.stdout.write('{:>22}: {:.0f} votes/s, p50 {:.1f}ms, p95 {:.1f}ms, {} "database is locked"{}'.format(
+                name, len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000 if latencies else 0,
+                latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0, errors, batches))
+
+    @staticmethod
+    def run_votes(voters, idea_ids, votes):
+        latencies, errors = [], []
+
+        def vote(voter):
+            try:
+                for _ in range(votes):
+                    started = time.perf_counter()
+                    try:
+                        run_write(apply_votes, [(random.choice(idea_ids), voter.pk,
+                                                 {'is_like': random.random() < 0.5})])
+                    except OperationalError:
+                        errors.append(1)
+                    else:
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=vote, args=(voter,)) for voter in voters]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, len(errors), time.perf_counter() - started
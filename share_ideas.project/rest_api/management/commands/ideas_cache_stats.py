@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from rest_api.cache import get_ideas_version, ideas_list_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the ideas list cache."
+
+    def handle(self, *args, **options):
+        stats = ideas_list_cache_stats()
+        self.stdout.write('Ideas version: {}'.format(get_ideas_version()))
+        self.stdout.write('Hits: {hits}, misses: {misses}, hit ratio: {hit_ratio:.2%}'.format(**stats))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rest_api.email import send_outbox
+
+
+class Command(BaseCommand):
+    help = "Send the mails waiting in the outbox, in batches over one mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Mails sent over one connection.')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Give up on a mail after so many failures.')
+        parser.add_argument('--backoff', type=int, default=60, help='First retry delay in seconds, doubled each time.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting once the outbox is empty.')
+        parser.add_argument('--interval', type=float, default=5, help='Polling interval in seconds for --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_outbox(batch_size=options['batch_size'],
+                                       max_attempts=options['max_attempts'],
+                                       backoff_seconds=options['backoff'])
+            if sent or failed:
+                self.stdout.write('Outbox: {} sent, {} failed'.format(sent, failed))
+            # ---------- drain full batches right away, then exit or wait for new mails
+            if sent + failed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
@@ -0,0 +1,160 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# -------- In-process request metrics -------------------
+# Request counts by URL name and status class and latency histograms by URL name,
+# exposed in the Prometheus text format. With METRICS_DIR set, every process dumps its
+# registry to its own file there (at most every METRICS_FLUSH_INTERVAL seconds and at exit),
+# and the scrape sums up all the files, so any worker answers for the whole server.
+# Clear the directory on deployment, files of finished processes are kept to keep the counters monotonic.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNRESOLVED = 'unresolved'
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # ---------- one flush at a time, a slower older snapshot never replaces a newer one
+        self.flush_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.requests = {}
+        self.durations = {}
+        self.file_name = '{}-{}.json'.format(self.pid, uuid.uuid4().hex)
+        self.flushed_at = time.monotonic()
+
+    def observe(self, view_name, status_code, duration):
+        view_name = view_name or UNRESOLVED
+        key = (view_name, '{}xx'.format(status_code // 100))
+        with self.lock:
+            if self.pid != os.getpid():
+                # ---------- forked worker, the parent's counts stay in the parent's file
+                self.reset()
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.durations.get(view_name)
+            if histogram is None:
+                histogram = self.durations[view_name] = {'buckets': [0] * (len(self.buckets) + 1),
+                                                         'sum': 0.0, 'count': 0}
+            histogram['buckets'][self.bucket_index(duration)] += 1
+            histogram['sum'] += duration
+            histogram['count'] += 1
+        self.maybe_flush()
+
+    def bucket_index(self, duration):
+        for index, bound in enumerate(self.buckets):
+            if duration <= bound:
+                return index
+        return len(self.buckets)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': [[view, status, count] for (view, status), count in self.requests.items()],
+                'durations': {view: {'buckets': list(histogram['buckets']), 'sum': histogram['sum'],
+                                     'count': histogram['count']} for view, histogram in self.durations.items()},
+            }
+
+    def maybe_flush(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        with self.lock:
+            # ---------- only one of the threads past the interval flushes
+            now = time.monotonic()
+            if now - self.flushed_at < getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0):
+                return
+            self.flushed_at = now
+        self.flush(directory)
+
+    def flush(self, directory=None):
+        """
+        Dump the registry to its file in METRICS_DIR. Errors are logged, metrics never fail a request.
+        """
+        directory = directory or getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        with self.flush_lock:
+            temp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                # ---------- the scrape never reads a half written file, it reads the .json files only
+                descriptor, temp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+                with os.fdopen(descriptor, 'w') as output:
+                    json.dump(self.snapshot(), output)
+                os.replace(temp_path, os.path.join(directory, self.file_name))
+            except OSError:
+                logger.exception('Metrics flush to %s failed', directory)
+                if temp_path is not None and os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def collect(self):
+        """
+        Return the snapshot of this process merged with the files of the other processes.
+        """
+        snapshots = [self.snapshot()]
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if not name.endswith('.json') or name == self.file_name:
+                    continue
+                try:
+                    with open(os.path.join(directory, name)) as source:
+                        snapshots.append(json.load(source))
+                except (OSError, ValueError):
+                    continue
+        return merge_snapshots(snapshots, len(self.buckets) + 1)
+
+
+def merge_snapshots(snapshots, buckets_count):
+    requests, durations = {}, {}
+    for snapshot in snapshots:
+        for view, status, count in snapshot['requests']:
+            requests[view, status] = requests.get((view, status), 0) + count
+        for view, histogram in snapshot['durations'].items():
+            merged = durations.setdefault(view, {'buckets': [0] * buckets_count, 'sum': 0.0, 'count': 0})
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], histogram['buckets'])]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+    return requests, durations
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(registry):
+    requests, durations = registry.collect()
+    lines = ['# HELP http_requests_total Requests by URL name and status class.',
+             '# TYPE http_requests_total counter']
+    for (view, status), count in sorted(requests.items()):
+        lines.append('http_requests_total{{view="{}",status="{}"}} {}'.format(_escape(view), status, count))
+
+    lines += ['# HELP http_request_duration_seconds Request latency by URL name.',
+              '# TYPE http_request_duration_seconds histogram']
+    for view, histogram in sorted(durations.items()):
+        view = _escape(view)
+        cumulative = 0
+        for bound, count in zip(registry.buckets + ('+Inf',), histogram['buckets']):
+            cumulative += count
+            lines.append('http_request_duration_seconds_bucket{{view="{}",le="{}"}} {}'.format(view, bound, cumulative))
+        lines.append('http_request_duration_seconds_sum{{view="{}"}} {}'.format(view, histogram['sum']))
+        lines.append('http_request_duration_seconds_count{{view="{}"}} {}'.format(view, histogram['count']))
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
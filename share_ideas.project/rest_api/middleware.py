@@ -0,0 +1,143 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .authentication import token_user_id
+from .db_router import check_pins_cache, is_user_pinned, pin_user_to_primary, use_primary
+from .metrics import registry
+
+logger = logging.getLogger('rest_api.timing')
+
+
+class RequestTimings:
+    """
+    Query count and SQL, view, render and total times (seconds) of one request.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.view_started = self.view_finished = self.render_finished = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # ---------- connection.execute_wrapper() hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - started
+            self.queries += 1
+
+    def as_dict(self, finished):
+        view_finished = self.view_finished or finished
+        return {
+            'queries': self.queries,
+            'sql': self.sql,
+            'view': view_finished - self.view_started if self.view_started else 0.0,
+            'render': self.render_finished - view_finished if self.render_finished else 0.0,
+            'total': finished - self.started,
+        }
+
+
+def server_timing(timings):
+    return ', '.join([
+        'db;dur={:.2f};desc="{} queries"'.format(timings['sql'] * 1000, timings['queries']),
+        'view;dur={:.2f}'.format(timings['view'] * 1000),
+        'render;dur={:.2f}'.format(timings['render'] * 1000),
+        'total;dur={:.2f}'.format(timings['total'] * 1000),
+    ])
+
+
+def log_request_timings(request, response, timings, send_header=False):
+    result = timings.as_dict(time.perf_counter())
+    if send_header:
+        response['Server-Timing'] = server_timing(result)
+    match = request.resolver_match
+    logger.info('%s %s %s status=%d queries=%d sql_ms=%.2f view_ms=%.2f render_ms=%.2f total_ms=%.2f',
+                match.view_name if match else '-', request.method, request.path, response.status_code,
+                result['queries'], result['sql'] * 1000, result['view'] * 1000, result['render'] * 1000,
+                result['total'] * 1000,
+                extra={'url_name': match.view_name if match else None, 'status_code': response.status_code,
+                       'timings': result})
+
+
+class RequestTimingMiddleware:
+    """
+    Log the query count and the SQL/view/render times of every request to the 'rest_api.timing'
+    logger, and send them in the Server-Timing header if REQUEST_TIMING_HEADER is set.
+    Unless REQUEST_TIMING is set, Django leaves the middleware out of the chain.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.send_header = getattr(settings, 'REQUEST_TIMING_HEADER', False)
+
+    def __call__(self, request):
+        request.timings = timings = RequestTimings()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            response = self.get_response(request)
+        # ---------- streamed content is produced after this point, it's counted in no phase
+        log_request_timings(request, response, timings, self.send_header)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timings.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # ---------- DRF responses are rendered by the handler after this hook
+        timings = request.timings
+        timings.view_finished = time.perf_counter()
+
+        def render_finished(response):
+            timings.render_finished = time.perf_counter()
+        response.add_post_render_callback(render_finished)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Count the requests and their latencies by URL name in the metrics registry (see rest_api.metrics).
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        registry.observe(match.view_name if match else None, response.status_code, time.perf_counter() - started)
+        return response
+
+
+class PrimaryPinningMiddleware:
+    """
+    Send the queries of the writes, and of the requests of a user who has written in the last
+    REPLICA_PIN_SECONDS, to the primary database (see rest_api.db_router).
+    Without DATABASE_REPLICAS Django leaves the middleware out of the chain.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            raise MiddlewareNotUsed
+        check_pins_cache()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        is_write = request.method not in SAFE_METHODS
+        with use_primary(is_write or is_user_pinned(token_user_id(request))):
+            response = self.get_response(request)
+
+        # ---------- DRF sets the authenticated user on the Django request too
+        user = getattr(request, 'user', None)
+        if is_write and response.status_code < 400 and user is not None and user.is_authenticated:
+            pin_user_to_primary(user.pk)
+        return response
@@ -1,3 +1,39 @@
+from django.core.mail import EmailMessage
 from django.db import models
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
 
 # Create your models here.
+
+
+class OutgoingMail(models.Model):
+    """
+    Rendered mail waiting in the outbox, sent by the `send_outbox` management command.
+    """
+    subject = models.CharField(max_length=255, verbose_name=_('subject'))
+    body = models.TextField(verbose_name=_('body'))
+    from_email = models.CharField(max_length=254, blank=True, default='', verbose_name=_('from'))
+    # ---------- recipients, one address per line
+    to = models.TextField(verbose_name=_('to'))
+    created_at = models.DateTimeField(verbose_name=_('created at'), default=timezone.now)
+    send_after = models.DateTimeField(verbose_name=_('send after'), default=timezone.now)
+    sent_at = models.DateTimeField(verbose_name=_('sent at'), null=True, blank=True, default=None)
+    attempts = models.PositiveSmallIntegerField(verbose_name=_('attempts'), default=0)
+    last_error = models.TextField(verbose_name=_('last error'), blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # ---------- pending mails lookup of the outbox worker
+            models.Index(fields=['sent_at', 'send_after'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return '{} -> {}'.format(self.subject, ', '.join(self.recipients))
+
+    @property
+    def recipients(self):
+        return [address for address in self.to.splitlines() if address]
+
+    def as_email_message(self, connection=None):
+        return EmailMessage(self.subject, self.body, from_email=self.from_email or None,
+                            to=self.recipients, connection=connection)
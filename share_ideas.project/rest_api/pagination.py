@@ -0,0 +1,140 @@
+import heapq
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from itertools import islice
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class IdeasCursorPagination(BasePagination):
+    """
+    Keyset pagination over (date_published, id), newest ideas first.
+    Every page is fetched with a single indexed range query, so the cost of
+    a page does not depend on how deep the client has scrolled.
+    """
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    results_key = 'all_ideas'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view=view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Paginate the union of querysets of disjoint rows, e.g. one queryset per shard:
+        every queryset reads its own page with the same range query, heapq.merge() keeps
+        the first page_size + 1 rows of the merged streams.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            reverse, position = False, None
+        else:
+            reverse, position = cursor
+
+        pages = [list(self.get_page_query(queryset, reverse, position)[:self.page_size + 1])
+                 for queryset in querysets]
+        if len(pages) == 1:
+            results = pages[0]
+        else:
+            merged = heapq.merge(*pages, key=self.get_position, reverse=not reverse)
+            results = list(islice(merged, self.page_size + 1))
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+
+        if results:
+            self.next_position = self.get_position(results[-1])
+            self.previous_position = self.get_position(results[0])
+        else:
+            # ---------- empty page: both directions continue from the requested position
+            self.next_position = self.previous_position = position
+        return results
+
+    @staticmethod
+    def get_page_query(queryset, reverse, position):
+        if position is None:
+            return queryset.order_by('-date_published', '-id')
+        published, pk = position
+        if reverse:
+            return queryset.filter(
+                Q(date_published__gt=published) | Q(date_published=published, id__gt=pk)
+            ).order_by('date_published', 'id')
+        return queryset.filter(
+            Q(date_published__lt=published) | Q(date_published=published, id__lt=pk)
+        ).order_by('-date_published', '-id')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    @staticmethod
+    def get_position(item):
+        if isinstance(item, dict):
+            return item['date_published'], item['id']
+        return item.date_published, item.id
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            published = parse_datetime(data['d'])
+            pk = int(data['i'])
+            reverse = bool(data.get('r', False))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if published is None:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, (published, pk)
+
+    def encode_cursor(self, position, reverse=False):
+        published, pk = position
+        data = {'d': published.isoformat(), 'i': pk}
+        if reverse:
+            data['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.previous_position is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_data(self, data):
+        return {
+            self.results_key: data,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 
 
@@ -13,3 +16,12 @@ def by_method_permission_classes(overridden_permission_classes):
 class IsIdeaOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
         return True if request.user == obj.author else False
+
+
+class CanScrapeMetrics(BasePermission):
+    def has_permission(self, request, view):
+        if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+            return True
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(token) and hmac.compare_digest(authorization.encode(), 'Bearer {}'.format(token).encode())
@@ -1,7 +1,12 @@
+from collections import OrderedDict
 from rest_framework import exceptions, serializers
+from rest_framework.reverse import reverse
+from rest_framework.utils.serializer_helpers import ReturnList
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q
 from ideas_place.models import Idea, Likes
+from ideas_place.sharding import shard_for_idea
+from ideas_place.vote_buffer import is_vote_buffer_enabled, vote_buffer
+from ideas_place.votes import apply_vote_changes, apply_votes
 from django.contrib.auth.password_validation import validate_password
 from django.core import exceptions as django_exceptions
 from django.db import IntegrityError
@@ -14,20 +19,25 @@ from django.dispatch import Signal
 _usermodel = get_user_model()
 
 
-class FullCustomUserSerializer(serializers.ModelSerializer):
-    ideas = serializers.HyperlinkedRelatedField(many=True, view_name='rest_api:user-detail', read_only=True)
+class ShortCustomUserSerializer(serializers.ModelSerializer):
+    """
+    Profile with the ideas count and the links of the newest ideas only (the `first_ideas`
+    loaded by the view), the rest is paginated by the `ideas_url` endpoint.
+    """
+    ideas_count = serializers.IntegerField(read_only=True)
+    ideas = serializers.HyperlinkedRelatedField(many=True, view_name='rest_api:idea-detail', read_only=True,
+                                                source='first_ideas')
+    ideas_url = serializers.HyperlinkedIdentityField(view_name='rest_api:user-ideas', read_only=True)
 
     class Meta:
         model = _usermodel
-        fields = ['username', 'email', 'ideas', ]
+        fields = ['username', 'ideas_count', 'ideas', 'ideas_url', ]
 
 
-class ShortCustomUserSerializer(serializers.ModelSerializer):
-    ideas = serializers.HyperlinkedRelatedField(many=True, view_name='rest_api:user-detail', read_only=True)
+class FullCustomUserSerializer(ShortCustomUserSerializer):
 
-    class Meta:
-        model = _usermodel
-        fields = ['username', 'ideas', ]
+    class Meta(ShortCustomUserSerializer.Meta):
+        fields = ['username', 'email', 'ideas_count', 'ideas', 'ideas_url', ]
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -112,40 +122,154 @@ class UserActivateSerializer(UidTokenSerializer):
         raise exceptions.PermissionDenied(self.error_messages["stale_token"])
 
 
+class IdeaRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField looking the idea up on its shard (see ideas_place.sharding).
+    """
+    def to_internal_value(self, data):
+        try:
+            queryset = self.get_queryset().using(shard_for_idea(data))
+            return queryset.get(pk=data)
+        except Idea.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
 class LikesSerializer(serializers.ModelSerializer):
+    parent_idea = IdeaRelatedField(queryset=Idea.objects.all(), write_only=True)
+    # ---------- the flags of the former Likes columns, kept by the API (see Likes.vote)
+    is_like = serializers.NullBooleanField(required=False)
+    is_unlike = serializers.NullBooleanField(required=False)
     overall_likes = serializers.IntegerField(read_only=True)
     overall_unlikes = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Likes
         fields = ['parent_idea', 'user', 'is_like', 'is_unlike', 'overall_likes', 'overall_unlikes']
-        extra_kwargs = {'parent_idea': {'write_only': True}, 'user': {'write_only': True}}
+        extra_kwargs = {'user': {'write_only': True}}
 
-    # def validate(self, attrs):
-    #     pass
+    def validate(self, attrs):
+        if attrs.get('is_like') and attrs.get('is_unlike'):
+            raise ValidationError('A vote is either a like or an unlike.')
+        return attrs
 
     def create(self, validated_data):
-        return Likes.objects.create(**validated_data)
+        parent_idea = validated_data.pop('parent_idea')
+        user = validated_data.pop('user', None)
+        return self._save_vote(parent_idea, user, validated_data)
 
     def update(self, instance, validate_data):
-        instance.is_like = validate_data.get('is_like', instance.is_like)
-        instance.is_unlike = validate_data.get('is_unlike', instance.is_unlike)
-        instance.save()
-        return instance
+        return self._save_vote(instance.parent_idea, instance.user, validate_data)
+
+    @staticmethod
+    def _save_vote(parent_idea, user, changes):
+        changes = {key: value for key, value in changes.items() if key in ('is_like', 'is_unlike')}
+        if is_vote_buffer_enabled():
+            # ---------- saved later by the write-behind buffer, see ideas_place.vote_buffer
+            vote_buffer.add(parent_idea.pk, getattr(user, 'pk', None), changes)
+            return Likes(parent_idea=parent_idea, user=user, **changes)
+        saved = apply_votes([(parent_idea.pk, getattr(user, 'pk', None), changes)])
+        return Likes(parent_idea=parent_idea, user=user, vote=saved[(parent_idea.pk, user.pk)])
+
+
+class BulkLikesSerializer(LikesSerializer):
+    """
+    One entry of a batch vote, validated with the LikesSerializer rules.
+    Ideas are checked for the whole batch at once by the view.
+    """
+    idea_id = serializers.IntegerField()
+
+    class Meta(LikesSerializer.Meta):
+        fields = ['idea_id', 'is_like', 'is_unlike']
+
+
+class SparseFieldsMixin:
+    """
+    Serializer taking the names of the `fields` to keep, the other fields are left out.
+    """
+    # ---------- model fields read by the serializer fields which are not model fields themselves
+    field_sources = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
+    @classmethod
+    def model_fields(cls, fields=None):
+        """
+        Return the model fields to load (see QuerySet.only()) for the given serializer fields.
+        """
+        return [source for name in (fields or cls.Meta.fields) for source in cls.field_sources.get(name, (name,))]
 
-class IdeasListSerializer(serializers.HyperlinkedModelSerializer):
+
+class IdeasListSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     author = serializers.HyperlinkedRelatedField(view_name='rest_api:user-detail', read_only=True)
     url = serializers.HyperlinkedIdentityField(view_name='rest_api:idea-detail', read_only=True, lookup_field='pk')
+    field_sources = {'url': ('id',)}
 
     class Meta:
         model = Idea
         fields = ['url', 'i_title', 'author', 'date_published']
 
 
-class IdeaSerializer(serializers.ModelSerializer):
+class IdeasListFastSerializer:
+    """
+    Read-only IdeasListSerializer for the .values() rows of a page, same output,
+    but the urls are built from one reverse() per page instead of one per row and field.
+    """
+    Meta = IdeasListSerializer.Meta
+    # ---------- serializer field -> key of the .values() row
+    value_sources = {'url': 'id', 'i_title': 'i_title', 'author': 'author', 'date_published': 'date_published'}
+
+    def __init__(self, rows, context, fields=None):
+        self.rows = rows
+        self.request = context['request']
+        self.fields = [name for name in self.Meta.fields if fields is None or name in fields]
+
+    @classmethod
+    def values_fields(cls, fields=None):
+        return [cls.value_sources[name] for name in (fields or cls.Meta.fields)]
+
+    def url_builder(self, view_name):
+        # ---------- same reverse() as the hyperlinked fields, so the host and preserved ?format= match
+        url = reverse(view_name, kwargs={'pk': 0}, request=self.request)
+        prefix, suffix = url.rsplit('/0/', 1)
+        prefix, suffix = prefix + '/', '/' + suffix
+        return lambda pk: prefix + str(pk) + suffix
+
+    @property
+    def data(self):
+        formatters = {
+            'url': self.url_builder('rest_api:idea-detail'),
+            'i_title': None,
+            'author': self.url_builder('rest_api:user-detail'),
+            'date_published': serializers.DateTimeField().to_representation,
+        }
+        columns = [(name, self.value_sources[name], formatters[name]) for name in self.fields]
+        results = []
+        for row in self.rows:
+            item = OrderedDict()
+            for name, key, formatter in columns:
+                value = row[key]
+                item[name] = formatter(value) if formatter is not None and value is not None else value
+            results.append(item)
+        return ReturnList(results, serializer=self)
+
+
+class HotIdeaSerializer(IdeasListSerializer):
+    score = serializers.FloatField(source='hotness.score', read_only=True)
+
+    class Meta(IdeasListSerializer.Meta):
+        fields = IdeasListSerializer.Meta.fields + ['score']
+
+
+class IdeaSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author = serializers.HyperlinkedRelatedField(view_name='rest_api:user-detail', read_only=True)
     likes_status = serializers.SerializerMethodField()
+    field_sources = {'likes_status': ('overall_likes', 'overall_unlikes')}
 
     class Meta:
         model = Idea
@@ -162,17 +286,24 @@ class IdeaSerializer(serializers.ModelSerializer):
         return instance
 
     def get_likes_status(self, obj):
-
-        try:
-            particular_users_likes = Likes.objects.get(user=self.context['current_user'], parent_idea=obj)
-        except:
-            particular_users_likes = Likes({'is_like': False, 'is_unlike': False})
-
-        overall_likes_status = Likes.objects.filter(
-            parent_idea=obj).aggregate(
-            overall_likes=Count('is_like', filter=Q(is_like=True)),
-            overall_unlikes=Count('is_unlike', filter=Q(is_unlike=True)))
-        setattr(particular_users_likes, 'overall_likes', overall_likes_status['overall_likes'])
-        setattr(particular_users_likes, 'overall_unlikes', overall_likes_status['overall_unlikes'])
+        if hasattr(obj, 'user_vote'):
+            # ---------- the caller's vote was annotated by IdeaQuerySet.with_vote_of()
+            stored_vote = obj.user_vote
+        else:
+            stored_vote = Likes.objects.using(shard_for_idea(obj.pk)).filter(
+                user=self.context['current_user'], parent_idea=obj).values_list('vote', flat=True).first()
+        stored_vote = stored_vote if stored_vote is not None else Likes.NO_VOTE
+        particular_users_likes = Likes(vote=stored_vote)
+
+        overall_likes, overall_unlikes = obj.overall_likes, obj.overall_unlikes
+        pending = vote_buffer.pending_vote(obj.pk, self.context['current_user'].pk)
+        if pending is not None:
+            # ---------- the caller's own vote waiting in the write-behind buffer, counters included
+            particular_users_likes.vote = apply_vote_changes(stored_vote, pending)
+            overall_likes += particular_users_likes.is_like - (stored_vote == Likes.LIKE)
+            overall_unlikes += particular_users_likes.is_unlike - (stored_vote == Likes.UNLIKE)
+
+        setattr(particular_users_likes, 'overall_likes', overall_likes)
+        setattr(particular_users_likes, 'overall_unlikes', overall_unlikes)
         serializer = LikesSerializer(particular_users_likes)
         return serializer.data
@@ -0,0 +1,15 @@
+from .serializers import UserActivateSerializer
+
+
+def activate_user(activation_data):
+    """
+    Check the activation uid/token with UserActivateSerializer and activate the user.
+    Raise ValidationError for a wrong uid/token and PermissionDenied for a stale one.
+    """
+    serializer = UserActivateSerializer(data=activation_data)
+    serializer.is_valid(raise_exception=True)
+
+    user = serializer.user
+    user.is_active = True
+    user.save(update_fields=['is_active'])
+    return user
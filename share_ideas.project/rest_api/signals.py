@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ideas_place.models import Idea
+from ideas_place.signals import ideas_bulk_created
+from users.models import CustomUser, auth_fields_updated
+from .authentication import invalidate_cached_user
+from .cache import bump_ideas_version
+
+
+@receiver(post_save, sender=Idea, dispatch_uid='ideas_list_cache_idea_saved')
+@receiver(post_delete, sender=Idea, dispatch_uid='ideas_list_cache_idea_deleted')
+@receiver(ideas_bulk_created, dispatch_uid='ideas_list_cache_ideas_bulk_created')
+def invalidate_ideas_list(sender, **kwargs):
+    bump_ideas_version()
+
+
+@receiver(post_delete, sender=CustomUser, dispatch_uid='ideas_list_cache_author_deleted')
+def invalidate_ideas_list_authors(sender, **kwargs):
+    # ---------- ideas of a deleted author lose their author link by a bulk UPDATE, without Idea signals
+    bump_ideas_version()
+
+
+@receiver(post_save, sender=CustomUser, dispatch_uid='jwt_user_cache_user_saved')
+@receiver(post_delete, sender=CustomUser, dispatch_uid='jwt_user_cache_user_deleted')
+def invalidate_jwt_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(auth_fields_updated, sender=CustomUser, dispatch_uid='jwt_user_cache_auth_fields_updated')
+def invalidate_jwt_users(sender, user_ids, **kwargs):
+    for user_id in user_ids:
+        invalidate_cached_user(user_id)
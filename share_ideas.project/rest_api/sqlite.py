@@ -0,0 +1,113 @@
+import contextvars
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+# -------- SQLite in production -------------------
+# SQLITE_PRAGMAS are set on every new SQLite connection: WAL lets the readers run next to the
+# writer, busy_timeout makes a writer wait for the lock instead of failing at once,
+# synchronous=NORMAL stays consistent with WAL (a power loss may drop the last commits only),
+# mmap_size/cache_size keep the hot pages in memory.
+# A transaction which reads before it writes (apply_votes) still fails with "database is locked"
+# when another connection has written meanwhile, no timeout helps there. With SQLITE_WRITE_QUEUE
+# the small writes of the API run on one writer thread per process instead, the writes queued
+# while a transaction commits go together into the next one.
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    # ---------- connection_created receiver, see RestApiConfig.ready()
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+class WriteQueue:
+    """
+    Run the submitted write functions on one writer thread, up to `batch_size` of them in a
+    transaction. Every function runs in its own savepoint, a failing write doesn't undo the
+    others. submit() waits for the commit and returns the function's result or raises its error.
+    """
+    def __init__(self, using=DEFAULT_DB_ALIAS, batch_size=100):
+        self.using = using
+        self.batch_size = batch_size
+        self.batches = self.writes = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._jobs = None
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        self._get_jobs().put((contextvars.copy_context(), function, args, kwargs, future))
+        return future.result()
+
+    def _get_jobs(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # ---------- a forked worker has no writer thread yet
+                self._pid = os.getpid()
+                self._jobs = queue.SimpleQueue()
+                threading.Thread(target=self._run, args=(self._jobs,), name='sqlite-writer', daemon=True).start()
+            return self._jobs
+
+    def _run(self, jobs):
+        while True:
+            batch = [jobs.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        close_old_connections()
+        results = []
+        try:
+            with transaction.atomic(using=self.using):
+                for context, function, args, kwargs, future in batch:
+                    try:
+                        with transaction.atomic(using=self.using):
+                            results.append((future, context.run(function, *args, **kwargs), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_write_queues = {}
+_write_queues_lock = threading.Lock()
+
+
+def get_write_queue(using=DEFAULT_DB_ALIAS):
+    with _write_queues_lock:
+        if using not in _write_queues:
+            _write_queues[using] = WriteQueue(using, getattr(settings, 'SQLITE_WRITE_QUEUE_BATCH_SIZE', 100))
+        return _write_queues[using]
+
+
+def run_write(function, *args, **kwargs):
+    """
+    Run a small write through the writer thread of 'default' with SQLITE_WRITE_QUEUE, right away
+    otherwise or inside a transaction (its uncommitted rows are not visible to the writer).
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if not getattr(settings, 'SQLITE_WRITE_QUEUE', False) or connection.vendor != 'sqlite' \
+            or connection.in_atomic_block:
+        return function(*args, **kwargs)
+    return get_write_queue().submit(function, *args, **kwargs)
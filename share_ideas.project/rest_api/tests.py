@@ -1,11 +1,49 @@
-from django.test import TestCase
-from rest_framework.test import APITestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+from datetime import timedelta
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APITestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from io import StringIO
+from smtplib import SMTPException
 from django.core import mail
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from django.utils.http import http_date
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
 # Create your tests here.
-from ideas_place.models import Idea, Likes
+from ideas_place.hot import refresh_hot_ideas
+from ideas_place.models import HotIdea, Idea, IdeaIdSequence, Likes
+from ideas_place.search import ensure_search_index
+from ideas_place.vote_buffer import vote_buffer
+from ideas_place.votes import apply_votes
+from ideas_place.sharding import shard_for_author
+from .async_views import ASYNC_READ_VIEWS, AsyncReadRouter, resolve_async_view
+from .authentication import user_cache_key
+from .cache import get_ideas_version, ideas_list_cache_stats
+from .email import account_activation_token, queue_mail, send_outbox
+from .metrics import registry
+from .models import OutgoingMail
+from .serializers import IdeasListFastSerializer, IdeasListSerializer
+from .sqlite import get_write_queue, run_write
 
 _usermodel = get_user_model()
 
@@ -21,6 +59,41 @@ def get_activation_info(body_string=None):
     return {'uid': uid, 'token': token}
 
 
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException('Mail server is not available')
+
+
+class RecordingEmailBackend(BaseEmailBackend):
+    # ---------- what the outbox looks like from the database while a mail is being sent
+    sends = []
+
+    def send_messages(self, email_messages):
+        self.sends.append((connection.in_atomic_block, OutgoingMail.objects.get().send_after))
+        return len(email_messages)
+
+
+class AuthenticatedClientMixin:
+    """
+    Active users and their bearer tokens, shared by the test cases of the API.
+    """
+    password = 'Testpassword123'
+
+    def create_user(self, username, email, password=None, **extra_fields):
+        return _usermodel.objects.create_user(username=username, email=email, password=password or self.password,
+                                              is_active=True, **extra_fields)
+
+    def obtain_token(self, username, password=None):
+        return self.client.post(reverse('token_obtain_pair'),
+                                {'username': username, 'password': password or self.password, },
+                                format='json').data['access']
+
+    def authenticate(self, token, client=None):
+        client = client or self.client
+        client.credentials(HTTP_AUTHORIZATION="Bearer  {}".format(token))
+        return client
+
+
 class IdeaModelTestCase(TestCase):
     def setUp(self):
         self.first_user = _usermodel(username="first_user", email="qqq@qqq.com", password='PpPp123456', is_active=True)
@@ -83,6 +156,11 @@ class AccountCreationTest(APITestCase):
         self.assertContains(response, 'No active account found with the given credentials', status_code=401)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+        # ---------- confirmation message waits in the outbox until the worker sends it
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingMail.objects.filter(sent_at__isnull=True).count(), 1)
+        call_command('send_outbox', stdout=StringIO())
+
         # ---------- We want to make sure confirmation message is sent
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].subject, 'Mail confirmation message')
@@ -107,14 +185,16 @@ class AccountCreationTest(APITestCase):
         access_token = response.data.get('access')
 
         # ---------- attempt to get another user's information with auth token
-        user_brief_right_data = {'author': {'username': 'testuser', 'ideas': []}}
+        user_brief_right_data = {'author': {'username': 'testuser', 'ideas_count': 0, 'ideas': [],
+                                            'ideas_url': 'http://testserver/api/v1/users/1/ideas/'}}
         # set request's auth header
         self.client.credentials(HTTP_AUTHORIZATION="Bearer  {}".format(access_token))
         response = self.client.get(self.get_user_1_info, format='json')
         self.assertEqual(user_brief_right_data, response.data)
 
         # ---------- attempt to get user's himself information with auth token
-        user_full_right_data = {'author': {'username': 'adminadmin', 'email': 'ee2020@gmail.com', 'ideas': []}}
+        user_full_right_data = {'author': {'username': 'adminadmin', 'email': 'ee2020@gmail.com', 'ideas_count': 0,
+                                           'ideas': [], 'ideas_url': 'http://testserver/api/v1/users/2/ideas/'}}
         response = self.client.get(self.get_user_2_info, format='json')
         self.assertEqual(user_full_right_data, response.data)
 
@@ -350,6 +430,33 @@ class IdeaLikingUpdateDeleteTest(APITestCase):
             self.assertIn(key, response.data['idea'].keys())
             self.assertIn(value, response.data['idea'].values())
 
+    def test_bulk_idea_liking(self):
+        print('test_bulk_idea_liking-14')
+        bulk_likes_url = reverse('rest_api:likes-bulk-add')
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer  {}".format(self.token_user1))
+        likes_statuses = [{'idea_id': 4, 'is_like': True, 'is_unlike': False},
+                          {'idea_id': 5, 'is_like': False, 'is_unlike': True},
+                          {'idea_id': 400, 'is_like': True},
+                          {'idea_id': 6, 'is_like': 'maybe'},
+                          {'idea_id': 4, 'is_unlike': True}]
+        response = self.client.post(bulk_likes_url, {'likes_statuses': likes_statuses}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        results = response.data['results']
+        self.assertEqual(len(results), 5)
+        # ---------- repeated votes for the same idea are applied in order, the unlike replaces the like
+        self.assertEqual(results[0]['likes_status'], {'is_like': False, 'is_unlike': True})
+        self.assertEqual(results[4]['likes_status'], {'is_like': False, 'is_unlike': True})
+        self.assertEqual(results[1]['likes_status'], {'is_like': False, 'is_unlike': True})
+        self.assertIn('idea_id', results[2]['errors'])
+        self.assertIn('is_like', results[3]['errors'])
+
+        self.assertEqual(Likes.objects.filter(user=self.test_user1).count(), 2)
+        self.assertEqual(Idea.objects.filter(pk=4).values_list('overall_likes', 'overall_unlikes').get(), (0, 1))
+
+        response = self.client.post(bulk_likes_url, {'likes_statuses': {'idea_id': 4}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_successful_idea_update(self):
         print('test_successful_idea_update-7')
         # ---------- update user1 idea id=3
@@ -448,3 +555,1023 @@ class IdeaLikingUpdateDeleteTest(APITestCase):
 
         # ---------- find count of ideas in db after deletion
         self.assertEqual(Idea.objects.count(), 6)
+
+
+class IdeasListPaginationTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_user1 = self.create_user('testuser', 'test@example.com')
+        self.token_user1 = self.obtain_token('testuser')
+
+        # ---------- every second idea shares date_published with its neighbour, so id breaks the ties
+        start = timezone.now()
+        for number in range(7):
+            Idea.objects.create(i_title='Idea {}'.format(number), i_text='Text {}'.format(number),
+                                author=self.test_user1,
+                                date_published=start - timedelta(minutes=number // 2))
+
+        self.ideas_list_url = reverse('rest_api:idea-tool')
+        self.expected_urls = ['http://testserver/api/v1/ideas/{}/'.format(idea.pk) for idea in
+                              Idea.objects.order_by('-date_published', '-id')]
+
+    def test_ideas_list_cursor_pagination(self):
+        print('test_ideas_list_cursor_pagination-11')
+        self.authenticate(self.token_user1)
+
+        # ---------- walk forward through all pages
+        response = self.client.get(self.ideas_list_url, {'page_size': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['previous'])
+        pages = [response.data]
+        while pages[-1]['next'] is not None:
+            response = self.client.get(pages[-1]['next'], format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+
+        self.assertEqual([len(page['all_ideas']) for page in pages], [3, 3, 1])
+        walked_urls = [idea['url'] for page in pages for idea in page['all_ideas']]
+        self.assertEqual(walked_urls, self.expected_urls)
+
+        # ---------- walk back from the last page
+        response = self.client.get(pages[-1]['previous'], format='json')
+        self.assertEqual(response.data['all_ideas'], pages[1]['all_ideas'])
+        response = self.client.get(response.data['previous'], format='json')
+        self.assertEqual(response.data['all_ideas'], pages[0]['all_ideas'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_ideas_list_page_size_limit_and_wrong_cursor(self):
+        print('test_ideas_list_page_size_limit_and_wrong_cursor-12')
+        self.authenticate(self.token_user1)
+
+        # ---------- page size is capped by max_page_size, which is larger than the dataset
+        response = self.client.get(self.ideas_list_url, {'page_size': 1000}, format='json')
+        self.assertEqual(len(response.data['all_ideas']), 7)
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(self.ideas_list_url, {'cursor': 'wrong-cursor'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class IdeaDetailQueriesTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        self.test_user1 = self.create_user('testuser', 'test@example.com')
+        self.test_user2 = self.create_user('adminadmin', 'ee2010@gmail.com', 'PpPp123456')
+        self.token_user2 = self.obtain_token('adminadmin', 'PpPp123456')
+
+        self.idea = Idea.objects.create(i_title='U1 First title', i_text='U1 I1 text', author=self.test_user1,
+                                        overall_likes=1, overall_unlikes=1)
+        Likes.objects.create(parent_idea=self.idea, user=self.test_user1, is_like=True, is_unlike=False)
+        Likes.objects.create(parent_idea=self.idea, user=self.test_user2, is_like=False, is_unlike=True)
+        self.idea_url = reverse('rest_api:idea-detail', kwargs={'pk': self.idea.pk})
+
+    def test_idea_detail_is_single_query(self):
+        print('test_idea_detail_is_single_query-13')
+        self.authenticate(self.token_user2)
+
+        # ---------- one query for the authenticated user, one for the idea with the caller's vote
+        with self.assertNumQueries(2):
+            response = self.client.get(self.idea_url, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['idea']['likes_status'],
+                         {'is_like': False, 'is_unlike': True, 'overall_likes': 1, 'overall_unlikes': 1})
+
+
+class MailOutboxTest(TestCase):
+    def setUp(self):
+        self.queued_mail = queue_mail('Subject', 'Body', to=['first@example.com', 'second@example.com'])
+
+    def test_outbox_retries_with_backoff(self):
+        print('test_outbox_retries_with_backoff-15')
+        with self.settings(EMAIL_BACKEND='rest_api.tests.FailingEmailBackend'):
+            self.assertEqual(send_outbox(backoff_seconds=60), (0, 1))
+            # ---------- the failed mail is not due until its backoff is over
+            self.assertEqual(send_outbox(backoff_seconds=60), (0, 0))
+
+        self.queued_mail.refresh_from_db()
+        self.assertEqual(self.queued_mail.attempts, 1)
+        self.assertIn('Mail server is not available', self.queued_mail.last_error)
+        self.assertGreater(self.queued_mail.send_after, timezone.now())
+        self.assertEqual(len(mail.outbox), 0)
+
+        OutgoingMail.objects.update(send_after=timezone.now())
+        self.assertEqual(send_outbox(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ['first@example.com', 'second@example.com'])
+        self.assertEqual(send_outbox(), (0, 0))
+
+
+class IdeasListCacheTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_user1 = self.create_user('testuser', 'test@example.com')
+        self.token_user1 = self.obtain_token('testuser')
+        Idea.objects.create(i_title='U1 First title', i_text='U1 I1 text', author=self.test_user1)
+        self.ideas_list_url = reverse('rest_api:idea-tool')
+
+    def test_ideas_list_cache_hit_and_invalidation(self):
+        print('test_ideas_list_cache_hit_and_invalidation-16')
+        self.authenticate(self.token_user1)
+
+        response = self.client.get(self.ideas_list_url, format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # ---------- the authenticated user and the page both come from the caches
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(self.ideas_list_url, format='json')
+        self.assertEqual(cached_response['X-Cache'], 'HIT')
+        self.assertEqual(cached_response.data, response.data)
+
+        # ---------- every Idea write bumps the version
+        version = get_ideas_version()
+        response = self.client.post(self.ideas_list_url, {'new_idea': {'i_title': 'New', 'i_text': 'New'}},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(get_ideas_version(), version)
+
+        response = self.client.get(self.ideas_list_url, format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['all_ideas']), 2)
+        self.assertEqual(ideas_list_cache_stats(), {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3})
+
+
+class ConditionalGetTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        self.test_user1 = self.create_user('testuser', 'test@example.com')
+        self.test_user2 = self.create_user('adminadmin', 'ee2010@gmail.com', 'PpPp123456')
+        self.token_user2 = self.obtain_token('adminadmin', 'PpPp123456')
+        self.idea = Idea.objects.create(i_title='U1 First title', i_text='U1 I1 text', author=self.test_user1)
+        self.idea_url = reverse('rest_api:idea-detail', kwargs={'pk': self.idea.pk})
+        self.user_url = reverse('rest_api:user-detail', kwargs={'pk': self.test_user1.pk})
+
+    def test_idea_detail_conditional_get(self):
+        print('test_idea_detail_conditional_get-17')
+        self.authenticate(self.token_user2)
+        response = self.client.get(self.idea_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # ---------- the idea lookup only (the user is cached), nothing is serialized
+        with self.assertNumQueries(1):
+            response = self.client.get(self.idea_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(self.idea_url, format='json',
+                                   HTTP_IF_MODIFIED_SINCE=http_date(timezone.now().timestamp() + 60))
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # ---------- a vote changes the counters, so the old validator is stale
+        add_likes_url = reverse('rest_api:likes-add', kwargs={'pk': self.idea.pk})
+        self.client.post(add_likes_url, {'likes_status': {'is_like': True}}, format='json')
+        response = self.client.get(self.idea_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['idea']['likes_status']['overall_likes'], 1)
+
+    def test_idea_validators_change_with_author_deletion(self):
+        print('test_idea_validators_change_with_author_deletion-47')
+        self.authenticate(self.token_user2)
+        response = self.client.get(self.idea_url, format='json')
+        etag, updated_at = response['ETag'], Idea.objects.get(pk=self.idea.pk).updated_at
+
+        self.test_user1.delete()
+        response = self.client.get(self.idea_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['idea']['author'])
+        self.assertGreater(Idea.objects.get(pk=self.idea.pk).updated_at, updated_at)
+
+    def test_user_detail_conditional_get(self):
+        print('test_user_detail_conditional_get-18')
+        self.authenticate(self.token_user2)
+        etag = self.client.get(self.user_url, format='json')['ETag']
+
+        response = self.client.get(self.user_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # ---------- the profile lists the author's ideas
+        Idea.objects.create(i_title='U1 Second title', i_text='U1 I2 text', author=self.test_user1)
+        response = self.client.get(self.user_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class IdeaSearchTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        self.test_user1 = self.create_user('testuser', 'test@example.com')
+        self.token_user1 = self.obtain_token('testuser')
+        self.rocket = Idea.objects.create(i_title='Rocket garden', i_text='Grow rockets, water the rocket daily',
+                                          author=self.test_user1)
+        self.bicycle = Idea.objects.create(i_title='Bicycle', i_text='A bicycle with a small rocket engine',
+                                           author=self.test_user1)
+        Idea.objects.create(i_title='Kitchen', i_text='Nothing to see here', author=self.test_user1)
+        self.search_url = reverse('rest_api:idea-search')
+
+    def found_urls(self, response):
+        return [idea['url'] for idea in response.data['ideas']]
+
+    def idea_url(self, idea):
+        return 'http://testserver' + reverse('rest_api:idea-detail', kwargs={'pk': idea.pk})
+
+    def test_ideas_search_ranked_and_paginated(self):
+        print('test_ideas_search_ranked_and_paginated-19')
+        self.authenticate(self.token_user1)
+
+        response = self.client.get(self.search_url, {'q': 'rocket'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.found_urls(response), [self.idea_url(self.rocket), self.idea_url(self.bicycle)])
+
+        response = self.client.get(self.search_url, {'q': 'rocket', 'page_size': 1}, format='json')
+        self.assertEqual(self.found_urls(response), [self.idea_url(self.rocket)])
+        self.assertIsNone(response.data['previous'])
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual(self.found_urls(response), [self.idea_url(self.bicycle)])
+        self.assertIsNone(response.data['next'])
+
+        # ---------- query syntax characters are not an error
+        response = self.client.get(self.search_url, {'q': 'engine" (*'}, format='json')
+        self.assertEqual(self.found_urls(response), [self.idea_url(self.bicycle)])
+
+    def test_ideas_search_index_follows_changes(self):
+        print('test_ideas_search_index_follows_changes-20')
+        self.authenticate(self.token_user1)
+
+        self.bicycle.i_text = 'A bicycle with a basket'
+        self.bicycle.save()
+        self.rocket.delete()
+        response = self.client.get(self.search_url, {'q': 'rocket'}, format='json')
+        self.assertEqual(self.found_urls(response), [])
+
+        response = self.client.get(self.search_url, {'q': 'basket'}, format='json')
+        self.assertEqual(self.found_urls(response), [self.idea_url(self.bicycle)])
+
+
+class HotIdeasTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        self.test_user1 = self.create_user('testuser', 'test@example.com')
+        self.token_user1 = self.obtain_token('testuser')
+        self.ideas = [Idea.objects.create(i_title='Idea {}'.format(likes), i_text='Text', author=self.test_user1,
+                                          overall_likes=likes) for likes in (1, 1000, 10)]
+        call_command('refresh_hot_ideas', stdout=StringIO())
+        self.hot_url = reverse('rest_api:idea-hot')
+
+    def test_hot_ideas_top(self):
+        print('test_hot_ideas_top-21')
+        self.authenticate(self.token_user1)
+
+        # ---------- the authenticated user and the ranking
+        with self.assertNumQueries(2):
+            response = self.client.get(self.hot_url, {'limit': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([idea['i_title'] for idea in response.data['hot_ideas']], ['Idea 1000', 'Idea 10'])
+        self.assertGreater(response.data['hot_ideas'][0]['score'], response.data['hot_ideas'][1]['score'])
+
+
+class IdeasExportImportTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = self.create_user('adminadmin', 'ee2010@gmail.com', 'PpPp123456', is_staff=True)
+        self.token_admin = self.obtain_token('adminadmin', 'PpPp123456')
+        for number in range(5):
+            Idea.objects.create(i_title='Idea {}'.format(number), i_text='Exported text {}'.format(number),
+                                author=self.admin if number % 2 else None)
+
+    def test_ideas_export_and_import(self):
+        print('test_ideas_export_and_import-22')
+        self.authenticate(self.token_admin)
+        response = self.client.get(reverse('rest_api:ideas-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines(keepends=True)
+        self.assertEqual(len(lines), 5)
+
+        exported = list(Idea.objects.order_by('pk').values_list('pk', 'i_title', 'i_text', 'author',
+                                                                'date_published'))
+        Idea.objects.all().delete()
+
+        out = StringIO()
+        call_command('import_ideas', '-', '--keep-ids', '--chunk-size', '2', stdin=lines, stdout=out)
+        self.assertIn('5 idea(s) imported', out.getvalue())
+        self.assertEqual(list(Idea.objects.order_by('pk').values_list('pk', 'i_title', 'i_text', 'author',
+                                                                      'date_published')), exported)
+
+        # ---------- bulk created ideas are searchable and visible in the ideas list
+        response = self.client.get(reverse('rest_api:idea-search'), {'q': 'exported'}, format='json')
+        self.assertEqual(len(response.data['ideas']), 5)
+        response = self.client.get(reverse('rest_api:idea-tool'), format='json')
+        self.assertEqual(len(response.data['all_ideas']), 5)
+
+    def test_import_indexes_every_chunk(self):
+        print('test_import_indexes_every_chunk-41')
+        lines = ['{{"i_title": "Imported {0}", "i_text": "Chunked text {0}", "author": "adminadmin", '
+                 '"date_published": "2020-01-0{1}T00:00:00+00:00"}}\n'.format(number, number + 1)
+                 for number in range(5)]
+        call_command('import_ideas', '-', '--chunk-size', '2', stdin=lines, stdout=StringIO())
+
+        imported = Idea.objects.filter(i_title__startswith='Imported').order_by('pk')
+        self.assertEqual([idea.i_title for idea in imported], ['Imported {}'.format(number) for number in range(5)])
+        self.authenticate(self.token_admin)
+        response = self.client.get(reverse('rest_api:idea-search'), {'q': 'chunked'}, format='json')
+        self.assertEqual(sorted(item['i_title'] for item in response.data['ideas']),
+                         ['Imported {}'.format(number) for number in range(5)])
+
+    def test_ideas_export_is_for_staff_only(self):
+        print('test_ideas_export_is_for_staff_only-23')
+        _usermodel.objects.filter(pk=self.admin.pk).update(is_staff=False)
+        self.authenticate(self.token_admin)
+        response = self.client.get(reverse('rest_api:ideas-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AsyncReadViewsTest(AuthenticatedClientMixin, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = self.create_user('testuser', 'test@example.com')
+        for number in range(3):
+            self.idea = Idea.objects.create(i_title='Title {}'.format(number), i_text='Text {}'.format(number),
+                                            author=self.author)
+        Likes.objects.create(parent_idea=self.idea, user=self.author, is_like=True, is_unlike=False)
+        self.token = str(AccessToken.for_user(self.author))
+        self.application = get_asgi_application()
+
+    def asgi_get(self, application, path, token=None, method='GET'):
+        headers = [(b'host', b'testserver')]
+        if token:
+            headers.append((b'authorization', 'Bearer {}'.format(token).encode()))
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                 'root_path': '', 'headers': headers, 'server': ('testserver', 80), 'client': ('127.0.0.1', 0)}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(application(scope, receive, send))
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return messages[0]['status'], dict(messages[0]['headers']), body
+
+    def test_async_reads_match_sync_views(self):
+        print('test_async_reads_match_sync_views-24')
+        async_application = AsyncReadRouter(self.application)
+        for url in (reverse('rest_api:idea-tool'),
+                    reverse('rest_api:idea-detail', kwargs={'pk': self.idea.pk}),
+                    reverse('rest_api:user-detail', kwargs={'pk': self.author.pk})):
+            cache.clear()
+            sync_status, sync_headers, sync_body = self.asgi_get(self.application, url, self.token)
+            cache.clear()
+            async_status, async_headers, async_body = self.asgi_get(async_application, url, self.token)
+            self.assertEqual((async_status, async_body), (sync_status, sync_body))
+            if url != reverse('rest_api:idea-tool'):
+                self.assertEqual(async_headers[b'ETag'], sync_headers[b'ETag'])
+            for header in (b'Allow', b'Vary', b'X-Content-Type-Options', b'X-Frame-Options', b'Content-Length'):
+                self.assertEqual(async_headers.get(header), sync_headers.get(header), header)
+
+        # ---------- errors keep the DRF shape, writes are left to the sync views
+        status_code, headers, _ = self.asgi_get(async_application, reverse('rest_api:idea-tool'))
+        self.assertEqual(status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn(b'WWW-Authenticate', headers)
+        status_code, _, _ = self.asgi_get(async_application,
+                                          reverse('rest_api:idea-detail', kwargs={'pk': 0}), self.token)
+        self.assertEqual(status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(resolve_async_view({'type': 'http', 'method': 'DELETE',
+                                             'path': reverse('rest_api:idea-tool')}), (None, None))
+
+    def test_async_reads_leave_other_formats_to_sync_views(self):
+        print('test_async_reads_leave_other_formats_to_sync_views-42')
+        url = reverse('rest_api:idea-tool')
+        scope = {'type': 'http', 'method': 'GET', 'path': url}
+        self.assertIsNotNone(resolve_async_view(scope)[0])
+        self.assertIsNotNone(resolve_async_view(dict(scope, headers=[(b'accept', b'application/json')]))[0])
+        self.assertEqual(resolve_async_view(dict(scope, path=url.rstrip('/') + '.api')), (None, None))
+        self.assertEqual(resolve_async_view(dict(scope, query_string=b'format=api')), (None, None))
+        self.assertEqual(resolve_async_view(dict(scope, headers=[(b'accept', b'text/html')])), (None, None))
+
+        # ---------- unexpected errors get the response of the sync chain
+        async def failing_view(request, format=None):
+            raise RuntimeError('boom')
+
+        with mock.patch.dict(ASYNC_READ_VIEWS, {'rest_api:idea-tool': failing_view}), \
+                self.assertLogs('django.request', 'ERROR'):
+            status_code, headers, _ = self.asgi_get(AsyncReadRouter(self.application), url, self.token)
+        self.assertEqual(status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(headers[b'X-Frame-Options'], b'DENY')
+
+
+class CachedJWTAuthenticationTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        self.test_user1 = self.create_user('testuser', 'test@example.com')
+        self.token_user1 = self.obtain_token('testuser')
+        self.user_url = reverse('rest_api:user-detail', kwargs={'pk': self.test_user1.pk})
+
+    def test_authenticated_user_is_cached_until_saved(self):
+        print('test_authenticated_user_is_cached_until_saved-25')
+        self.authenticate(self.token_user1)
+        # ---------- the user, the profile and its ideas, then without the user
+        with self.assertNumQueries(3):
+            self.client.get(self.user_url, format='json')
+        with self.assertNumQueries(2):
+            response = self.client.get(self.user_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # ---------- deactivation drops the cached user, the token stops working at once
+        self.test_user1.is_active = False
+        self.test_user1.save(update_fields=['is_active'])
+        response = self.client.get(self.user_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.test_user1.delete()
+        response = self.client.get(self.user_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_user_follows_queryset_updates(self):
+        print('test_cached_user_follows_queryset_updates-45')
+        self.authenticate(self.token_user1)
+        self.assertEqual(self.client.get(self.user_url, format='json').status_code, status.HTTP_200_OK)
+        # ---------- the flags only, never the password hash
+        self.assertEqual(caches['users'].get(user_cache_key(self.test_user1.pk)),
+                         [self.test_user1.pk, True, False, False])
+
+        _usermodel.objects.filter(pk=self.test_user1.pk).update(is_active=False)
+        response = self.client.get(self.user_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class QueryCountRegressionTest(AuthenticatedClientMixin, APITestCase):
+    """
+    Every endpoint runs a fixed number of queries, whatever the amount of users, ideas and votes.
+    The caches are cleared before each request, so the counts are the ones of a cold request.
+    """
+    dataset_sizes = (1, 10, 40)
+
+    def setUp(self):
+        self.author = self.create_user('testuser', 'test@example.com')
+        self.token = str(AccessToken.for_user(self.author))
+        self.authenticate(self.token)
+        self.seeded = 0
+
+    def seed(self, size):
+        """
+        Grow the dataset to `size` users and as many ideas of the author, voted by all the users.
+        """
+        new = range(self.seeded, size)
+        _usermodel.objects.bulk_create([_usermodel(username='seed{}'.format(number), is_active=True,
+                                                   email='seed{}@example.com'.format(number)) for number in new])
+        Idea.objects.bulk_create([Idea(i_title='Idea {}'.format(number), i_text='Text', author=self.author)
+                                  for number in new])
+        ideas = Idea.objects.filter(i_title__in=['Idea {}'.format(number) for number in new])
+        voters = list(_usermodel.objects.all())
+        Likes.objects.bulk_create([
+            Likes(parent_idea=idea, user=voter, is_like=voter.pk % 2 == 0, is_unlike=voter.pk % 2 == 1)
+            for idea in ideas for voter in voters])
+        self.seeded = size
+
+    def assertQueriesPerSize(self, expected, request, prepare=None):
+        Idea.objects.all().delete()
+        _usermodel.objects.filter(username__startswith='seed').delete()
+        self.seeded = 0
+        for size in self.dataset_sizes:
+            self.seed(size)
+            data = prepare(size) if prepare else size
+            cache.clear()
+            caches['users'].clear()
+            with self.subTest(size=size), self.assertNumQueries(expected):
+                response = request(data)
+            self.assertLess(response.status_code, 400, response.data)
+
+    def test_read_endpoints_query_counts(self):
+        print('test_read_endpoints_query_counts-26')
+        # ---------- user, one page of plain idea rows (urls, title, author, date), authors and votes aren't joined
+        self.assertQueriesPerSize(2, lambda size: self.client.get(reverse('rest_api:idea-tool'), format='json'))
+        # ---------- user, idea with the caller's vote
+        self.assertQueriesPerSize(2, lambda url: self.client.get(url, format='json'), prepare=lambda size: reverse(
+            'rest_api:idea-detail', kwargs={'pk': Idea.objects.latest('pk').pk}))
+        # ---------- user, profile, author's ideas
+        self.assertQueriesPerSize(3, lambda size: self.client.get(
+            reverse('rest_api:user-detail', kwargs={'pk': self.author.pk}), format='json'))
+
+    def test_write_endpoints_query_counts(self):
+        print('test_write_endpoints_query_counts-27')
+        # ---------- user, idea, previous vote, upsert, counters and the savepoint pair of the transaction
+        self.assertQueriesPerSize(7, lambda url: self.client.post(
+            url, {'likes_status': {'is_like': True, 'is_unlike': False}}, format='json'), prepare=lambda size: reverse(
+            'rest_api:likes-add', kwargs={'pk': Idea.objects.latest('pk').pk}))
+
+        self.client.credentials()
+        # ---------- username and email checks, user and outgoing mail inserts
+        self.assertQueriesPerSize(4, lambda size: self.client.post(
+            reverse('rest_api:users-add'), {'new_user': {'username': 'newuser{}'.format(size),
+                                                         'email': 'new{}@example.com'.format(size),
+                                                         'password': 'PpPp123456'}}, format='json'))
+
+        def activation_data(size):
+            user = _usermodel.objects.create_user(username='inactive{}'.format(size),
+                                                  email='inactive{}@example.com'.format(size),
+                                                  password='PpPp123456', is_active=False)
+            return {'activation': {'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+                                   'token': account_activation_token.make_token(user)}}
+        # ---------- user lookup and update
+        self.assertQueriesPerSize(2, lambda data: self.client.post(reverse('rest_api:user-activate'), data,
+                                                                   format='json'), prepare=activation_data)
+
+        # ---------- credentials check only
+        self.assertQueriesPerSize(1, lambda size: self.client.post(
+            reverse('token_obtain_pair'), {'username': 'testuser', 'password': 'Testpassword123'}, format='json'))
+
+
+class RequestTimingMiddlewareTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        self.author = self.create_user('testuser', 'test@example.com')
+        self.idea = Idea.objects.create(i_title='Idea', i_text='Text', author=self.author)
+        self.authenticate(AccessToken.for_user(self.author))
+        self.idea_url = reverse('rest_api:idea-detail', kwargs={'pk': self.idea.pk})
+
+    @override_settings(REQUEST_TIMING=True, REQUEST_TIMING_HEADER=True)
+    def test_request_timings_header_and_log(self):
+        print('test_request_timings_header_and_log-28')
+        caches['users'].clear()
+        with self.assertLogs('rest_api.timing', level='INFO') as logs:
+            response = self.client.get(self.idea_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="2 queries", view;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertIn('rest_api:idea-detail GET {} status=200 queries=2'.format(self.idea_url), logs.output[0])
+        self.assertEqual(logs.records[0].url_name, 'rest_api:idea-detail')
+        self.assertGreater(logs.records[0].timings['render'], 0)
+
+    @override_settings(REQUEST_TIMING=True)
+    def test_request_timings_without_header(self):
+        print('test_request_timings_without_header-29')
+        with self.assertLogs('rest_api.timing', level='INFO'):
+            response = self.client.get(self.idea_url, format='json')
+        self.assertNotIn('Server-Timing', response)
+
+        # ---------- turned off, the middleware is not even in the chain
+        with self.settings(REQUEST_TIMING=False):
+            self.client = self.client_class()
+            self.authenticate(AccessToken.for_user(self.author))
+            response = self.client.get(self.idea_url, format='json')
+        self.assertNotIn('Server-Timing', response)
+        self.assertFalse(hasattr(response.wsgi_request, 'timings'))
+
+
+class MetricsTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.author = self.create_user('testuser', 'test@example.com')
+        # ---------- a file of another worker process
+        with open(os.path.join(self.metrics_dir.name, '1-other.json'), 'w') as other:
+            json.dump({'requests': [['rest_api:idea-tool', '2xx', 5]],
+                       'durations': {'rest_api:idea-tool': {'buckets': [5] + [0] * 11, 'sum': 0.02, 'count': 5}}},
+                      other)
+
+    def tearDown(self):
+        self.metrics_dir.cleanup()
+
+    def test_metrics_are_aggregated_across_processes(self):
+        print('test_metrics_are_aggregated_across_processes-30')
+        with self.settings(METRICS=True, METRICS_DIR=self.metrics_dir.name, METRICS_TOKEN='scrape-token'):
+            self.authenticate(self.obtain_token('testuser'))
+            self.client.get(reverse('rest_api:idea-tool'), format='json')
+            self.client.get(reverse('rest_api:idea-detail', kwargs={'pk': 404}), format='json')
+
+            # ---------- the users' tokens don't open the metrics
+            response = self.client.get(reverse('rest_api:metrics'))
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape-token')
+            response = self.client.get(reverse('rest_api:metrics'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response['Content-Type'].startswith('text/plain'))
+            lines = response.content.decode('utf-8').splitlines()
+
+            registry.flush()
+            self.assertIn(registry.file_name, os.listdir(self.metrics_dir.name))
+
+        self.assertIn('http_requests_total{view="token_obtain_pair",status="2xx"} 1', lines)
+        self.assertIn('http_requests_total{view="rest_api:idea-tool",status="2xx"} 6', lines)
+        self.assertIn('http_requests_total{view="rest_api:idea-detail",status="4xx"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="rest_api:idea-tool",le="+Inf"} 6', lines)
+        self.assertIn('http_request_duration_seconds_count{view="rest_api:idea-tool"} 6', lines)
+
+    def test_metrics_flush_never_fails_a_request(self):
+        print('test_metrics_flush_never_fails_a_request-44')
+        with self.settings(METRICS_DIR=self.metrics_dir.name):
+            threads = [threading.Thread(target=registry.flush) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sorted(os.listdir(self.metrics_dir.name)), sorted(['1-other.json', registry.file_name]))
+
+        # ---------- a path under a file can't be created
+        blocked = os.path.join(self.metrics_dir.name, '1-other.json', 'metrics')
+        with self.settings(METRICS_DIR=blocked, METRICS_FLUSH_INTERVAL=0), self.assertLogs('rest_api.metrics'):
+            registry.observe('rest_api:idea-tool', 200, 0.01)
+
+    def test_metrics_access(self):
+        print('test_metrics_access-43')
+        url = reverse('rest_api:metrics')
+        with self.settings(METRICS=True, METRICS_TOKEN=None, METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials()
+        with self.settings(METRICS=True, METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.settings(METRICS=False, METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SparseFieldsetsTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = self.create_user('testuser', 'test@example.com')
+        self.idea = Idea.objects.create(i_title='Idea', i_text='Long text ' * 100, author=self.author,
+                                        overall_likes=1)
+        Likes.objects.create(parent_idea=self.idea, user=self.author, is_like=True, is_unlike=False)
+        self.authenticate(AccessToken.for_user(self.author))
+        self.idea_url = reverse('rest_api:idea-detail', kwargs={'pk': self.idea.pk})
+
+    def get_with_queries(self, url, fields):
+        self.client.get(url, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': fields}, format='json')
+        return response, ' '.join(query['sql'] for query in queries.captured_queries)
+
+    def test_idea_detail_fields(self):
+        print('test_idea_detail_fields-31')
+        response, sql = self.get_with_queries(self.idea_url, 'i_title,likes_status')
+        self.assertEqual(response.data, {'idea': {'i_title': 'Idea', 'likes_status': {
+            'is_like': True, 'is_unlike': False, 'overall_likes': 1, 'overall_unlikes': 0}}})
+        self.assertNotIn('"i_text"', sql)
+
+        # ---------- without likes_status the caller's vote is not looked up
+        response, sql = self.get_with_queries(self.idea_url, 'i_title, author')
+        self.assertEqual(response.data, {'idea': {'i_title': 'Idea', 'author': 'http://testserver{}'.format(
+            reverse('rest_api:user-detail', kwargs={'pk': self.author.pk}))}})
+        self.assertNotIn('ideas_place_likes', sql)
+        self.assertNotEqual(response['ETag'], self.client.get(self.idea_url, format='json')['ETag'])
+
+        response = self.client.get(self.idea_url, {'fields': 'i_title,password'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'fields': ['Unknown field(s): password']})
+
+    def test_ideas_list_fields(self):
+        print('test_ideas_list_fields-32')
+        response, sql = self.get_with_queries(reverse('rest_api:idea-tool'), 'url,i_title')
+        self.assertEqual(response.data['all_ideas'], [{'url': 'http://testserver{}'.format(self.idea_url),
+                                                      'i_title': 'Idea'}])
+        self.assertNotIn('"i_text"', sql)
+
+        response = self.client.get(reverse('rest_api:idea-tool'), format='json')
+        self.assertEqual(list(response.data['all_ideas'][0]), ['url', 'i_title', 'author', 'date_published'])
+
+
+class IdeasListFastSerializerTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        self.author = self.create_user('testuser', 'test@example.com')
+        for number in range(3):
+            Idea.objects.create(i_title='Idea "{}" é'.format(number), i_text='Text',
+                                author=self.author if number % 2 else None)
+
+    def test_fast_serializer_output_is_identical(self):
+        print('test_fast_serializer_output_is_identical-33')
+        for query, fields in (({}, None), ({'format': 'json'}, None), ({}, ['url', 'date_published'])):
+            request = Request(APIRequestFactory().get(reverse('rest_api:idea-tool'), query))
+            context = {'request': request}
+            ideas = Idea.objects.order_by('-date_published', '-id')
+            expected = IdeasListSerializer(ideas, context=context, many=True, fields=fields).data
+            fast = IdeasListFastSerializer(ideas.values(*IdeasListFastSerializer.values_fields()),
+                                           context=context, fields=fields).data
+            self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+
+class UserIdeasTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        self.author = self.create_user('testuser', 'test@example.com')
+        self.reader = self.create_user('reader', 'reader@example.com')
+        start = timezone.now()
+        Idea.objects.bulk_create([Idea(i_title='Idea {}'.format(number), i_text='Text', author=self.author,
+                                       date_published=start - timedelta(minutes=number)) for number in range(25)])
+        Idea.objects.create(i_title='Other', i_text='Text', author=self.reader)
+        self.authenticate(AccessToken.for_user(self.reader))
+        self.idea_urls = ['http://testserver{}'.format(reverse('rest_api:idea-detail', kwargs={'pk': pk})) for pk in
+                          Idea.objects.filter(author=self.author).order_by('-date_published').values_list('pk',
+                                                                                                          flat=True)]
+
+    def test_profile_links_first_ideas_page(self):
+        print('test_profile_links_first_ideas_page-34')
+        response = self.client.get(reverse('rest_api:user-detail', kwargs={'pk': self.author.pk}), format='json')
+        author = response.data['author']
+        self.assertEqual(author['ideas_count'], 25)
+        self.assertEqual(author['ideas'], self.idea_urls[:20])
+
+        response = self.client.get(author['ideas_url'], format='json')
+        self.assertEqual([idea['url'] for idea in response.data['all_ideas']], self.idea_urls[:20])
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual([idea['url'] for idea in response.data['all_ideas']], self.idea_urls[20:])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(reverse('rest_api:user-ideas', kwargs={'pk': 404}), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PrimaryReplicaRoutingTest(AuthenticatedClientMixin, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        caches['users'].clear()
+        # ---------- a second SQLite file plays the replica, its rows lag behind the primary
+        _, self.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        connections.databases['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.replica_path}
+        connections.ensure_defaults('replica')
+        connections.prepare_test_settings('replica')
+        self.addCleanup(self.remove_replica)
+        with connections['replica'].schema_editor() as editor:
+            for model in (_usermodel, Idea, Likes):
+                editor.create_model(model)
+
+        self.author = self.create_user('testuser', 'test@example.com')
+        self.reader = self.create_user('reader', 'reader@example.com')
+        self.idea = Idea.objects.create(i_title='Primary title', i_text='Text', author=self.author)
+        _usermodel.objects.using('replica').bulk_create([self.author])
+        Idea.objects.using('replica').bulk_create([Idea(pk=self.idea.pk, i_title='Replica title', i_text='Text',
+                                                        author_id=self.author.pk)])
+        self.idea_url = reverse('rest_api:idea-detail', kwargs={'pk': self.idea.pk})
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections.databases['replica']
+        delattr(connections._connections, 'replica')
+        os.remove(self.replica_path)
+
+    def client_for(self, user):
+        return self.authenticate(AccessToken.for_user(user), APIClient())
+
+    def get_title(self, client):
+        return client.get(self.idea_url, format='json').data['idea']['i_title']
+
+    @override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_CACHE_ALIAS='pins', CACHES=dict(
+        settings.CACHES, pins={'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                               'LOCATION': os.path.join(tempfile.gettempdir(), 'share-ideas-test-pins')}))
+    def test_reads_go_to_replica_until_user_writes(self):
+        print('test_reads_go_to_replica_until_user_writes-35')
+        author_client, reader_client = self.client_for(self.author), self.client_for(self.reader)
+        self.assertEqual(self.get_title(author_client), 'Replica title')
+
+        response = author_client.put(self.idea_url, {'updated_idea': {'i_title': 'Updated title'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # ---------- the writer reads its own write, the others read the replica
+        self.assertEqual(self.get_title(author_client), 'Updated title')
+        self.assertEqual(self.get_title(reader_client), 'Replica title')
+
+        # ---------- a list page read from the lagging replica is not cached
+        reader_client.get(reverse('rest_api:idea-tool'), format='json')
+        response = reader_client.get(reverse('rest_api:idea-tool'), format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        caches['pins'].clear()
+        self.assertEqual(self.get_title(author_client), 'Replica title')
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_replicas_need_a_shared_pins_cache(self):
+        print('test_replicas_need_a_shared_pins_cache-48')
+        with self.assertRaises(ImproperlyConfigured):
+            self.client_for(self.author).get(self.idea_url, format='json')
+
+
+@override_settings(IDEA_SHARDS=['shard0', 'shard1'])
+class ShardedIdeasTest(AuthenticatedClientMixin, TransactionTestCase):
+    client_class = APIClient
+    shards = ['shard0', 'shard1']
+
+    def setUp(self):
+        cache.clear()
+        caches['users'].clear()
+        # ---------- two SQLite files play the shards, the users stay on 'default'
+        for alias in self.shards:
+            _, path = tempfile.mkstemp(suffix='.sqlite3')
+            connections.databases[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+            connections.ensure_defaults(alias)
+            connections.prepare_test_settings(alias)
+            self.addCleanup(self.remove_shard, alias, path)
+            # ---------- as the models are declared when IDEA_SHARDS is set at startup
+            with connections[alias].schema_editor() as editor, \
+                    mock.patch.object(Idea._meta.get_field('author'), 'db_constraint', False), \
+                    mock.patch.object(Likes._meta.get_field('user'), 'db_constraint', False):
+                for model in (Idea, Likes, HotIdea, IdeaIdSequence):
+                    editor.create_model(model)
+            ensure_search_index(alias)
+
+        # ---------- authors on both shards
+        self.authors = {}
+        number = 0
+        while len(self.authors) < len(self.shards):
+            number += 1
+            user = _usermodel.objects.create_user(username='author{}'.format(number),
+                                                  email='author{}@example.com'.format(number),
+                                                  password='Testpassword123', is_active=True)
+            self.authors.setdefault(shard_for_author(user.pk), user)
+        self.authenticate(AccessToken.for_user(self.authors['shard0']))
+
+    def remove_shard(self, alias, path):
+        connections[alias].close()
+        del connections.databases[alias]
+        delattr(connections._connections, alias)
+        os.remove(path)
+
+    def test_ideas_live_on_the_author_shard(self):
+        print('test_ideas_live_on_the_author_shard-36')
+        now = timezone.now()
+        ideas = []
+        for number in range(6):
+            author = self.authors[self.shards[number % 2]]
+            ideas.append(Idea.objects.create(i_title='Idea {}'.format(number), author=author,
+                                             date_published=now - timedelta(minutes=number)))
+        self.assertFalse(Idea.objects.using('default').exists())
+        for alias in self.shards:
+            shard_ideas = list(Idea.objects.using(alias).values_list('id', 'author'))
+            self.assertEqual(len(shard_ideas), 3)
+            for idea_id, author_id in shard_ideas:
+                self.assertEqual(self.shards[idea_id % 2], alias)
+                self.assertEqual(shard_for_author(author_id), alias)
+
+        # ---------- the list is the merge of the shards, newest first, page after page
+        listed = []
+        url = reverse('rest_api:idea-tool') + '?page_size=4'
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            listed += [item['i_title'] for item in response.data['all_ideas']]
+            url = response.data['next']
+        self.assertEqual(listed, [idea.i_title for idea in ideas])
+
+        # ---------- lookups by id, votes and deletions reach the idea's shard
+        idea = ideas[1]
+        idea_url = reverse('rest_api:idea-detail', kwargs={'pk': idea.pk})
+        response = self.client.post(reverse('rest_api:likes-add', kwargs={'pk': idea.pk}),
+                                    {'likes_status': {'is_like': True}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(idea_url, format='json')
+        self.assertEqual(response.data['idea']['i_title'], 'Idea 1')
+        self.assertEqual(response.data['idea']['likes_status']['overall_likes'], 1)
+        self.assertEqual(Likes.objects.using('shard1').filter(parent_idea=idea.pk).count(), 1)
+
+        response = self.client.get(reverse('rest_api:user-detail', kwargs={'pk': self.authors['shard1'].pk}),
+                                   format='json')
+        self.assertEqual(response.data['author']['ideas_count'], 3)
+
+        # ---------- every shard ranks its own ideas, the endpoint merges the rankings
+        self.assertEqual(refresh_hot_ideas(full=True), 6)
+        response = self.client.get(reverse('rest_api:idea-hot') + '?limit=2', format='json')
+        self.assertEqual([item['i_title'] for item in response.data['hot_ideas']], ['Idea 0', 'Idea 1'])
+
+        self.authenticate(AccessToken.for_user(self.authors['shard1']))
+        response = self.client.delete(idea_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Idea.objects.using('shard1').filter(pk=idea.pk).exists())
+        self.assertFalse(Likes.objects.using('shard1').exists())
+
+        # ---------- new ideas posted through the API get an id of their author's shard
+        response = self.client.post(reverse('rest_api:idea-tool'),
+                                    {'new_idea': {'i_title': 'Posted', 'i_text': 'Text'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        posted = Idea.objects.using('shard1').get(i_title='Posted')
+        self.assertEqual(posted.pk % 2, 1)
+
+
+class SQLiteProductionModeTest(AuthenticatedClientMixin, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        caches['users'].clear()
+        self.author = self.create_user('testuser', 'test@example.com')
+        self.idea = Idea.objects.create(i_title='Title', i_text='Text', author=self.author)
+
+    def test_pragmas_of_new_connections(self):
+        print('test_pragmas_of_new_connections-37')
+        _, path = tempfile.mkstemp(suffix='.sqlite3')
+        connections.databases['pragmas'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+        connections.ensure_defaults('pragmas')
+        connections.prepare_test_settings('pragmas')
+        try:
+            with connections['pragmas'].cursor() as cursor:
+                pragmas = {}
+                for name in ('journal_mode', 'busy_timeout', 'synchronous', 'cache_size'):
+                    cursor.execute('PRAGMA {}'.format(name))
+                    pragmas[name] = cursor.fetchone()[0]
+        finally:
+            connections['pragmas'].close()
+            del connections.databases['pragmas']
+            delattr(connections._connections, 'pragmas')
+            os.remove(path)
+        # ---------- synchronous NORMAL is 1
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'busy_timeout': 5000, 'synchronous': 1,
+                                   'cache_size': -64 * 1024})
+
+    @override_settings(SQLITE_WRITE_QUEUE=True)
+    def test_concurrent_votes_through_write_queue(self):
+        print('test_concurrent_votes_through_write_queue-38')
+        voters = [_usermodel.objects.create_user(username='voter{}'.format(number),
+                                                 email='voter{}@example.com'.format(number),
+                                                 password='Testpassword123', is_active=True) for number in range(8)]
+        write_queue = get_write_queue()
+        writes = write_queue.writes
+        saved = []
+
+        # ---------- the voters' threads don't read, the shared in-memory test database locks whole tables
+        def vote(voter):
+            saved.append(run_write(apply_votes, [(self.idea.pk, voter.pk, {'is_like': True})]))
+
+        threads = [threading.Thread(target=vote, args=(voter,)) for voter in voters[1:]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(saved), len(voters) - 1)
+
+        client = self.authenticate(AccessToken.for_user(voters[0]), APIClient())
+        response = client.post(reverse('rest_api:likes-add', kwargs={'pk': self.idea.pk}),
+                               {'likes_status': {'is_like': True}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(write_queue.writes - writes, len(voters))
+        self.idea.refresh_from_db()
+        self.assertEqual(self.idea.overall_likes, len(voters))
+        self.assertEqual(Likes.objects.filter(parent_idea=self.idea, vote=Likes.LIKE).count(), len(voters))
+
+        # ---------- a failing write is reported to its caller only
+        with self.assertRaises(ZeroDivisionError):
+            write_queue.submit(lambda: 1 / 0)
+        self.assertEqual(write_queue.submit(lambda: Idea.objects.filter(pk=self.idea.pk).update(i_title='Queued')), 1)
+        self.assertEqual(Idea.objects.get(pk=self.idea.pk).i_title, 'Queued')
+
+    @override_settings(SQLITE_WRITE_QUEUE=True, VOTE_BUFFER=True, VOTE_BUFFER_FLUSH_MS=60000)
+    def test_vote_buffer_flushes_through_write_queue(self):
+        print('test_vote_buffer_flushes_through_write_queue-46')
+        write_queue = get_write_queue()
+        writes = write_queue.writes
+        vote_buffer.add(self.idea.pk, self.author.pk, {'is_like': True})
+        self.assertEqual(vote_buffer.flush(), 1)
+        self.assertEqual(write_queue.writes - writes, 1)
+        self.idea.refresh_from_db()
+        self.assertEqual(self.idea.overall_likes, 1)
+
+
+@override_settings(VOTE_BUFFER=True, VOTE_BUFFER_FLUSH_MS=60000)
+class VoteBufferTest(AuthenticatedClientMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        caches['users'].clear()
+        self.voter = self.create_user('testuser', 'test@example.com')
+        self.reader = self.create_user('reader', 'reader@example.com')
+        self.idea = Idea.objects.create(i_title='Title', i_text='Text', author=self.reader)
+        self.idea_url = reverse('rest_api:idea-detail', kwargs={'pk': self.idea.pk})
+        self.likes_url = reverse('rest_api:likes-add', kwargs={'pk': self.idea.pk})
+        self.authenticate(AccessToken.for_user(self.voter))
+
+    def likes_status_of(self, user):
+        client = self.authenticate(AccessToken.for_user(user), APIClient())
+        return client.get(self.idea_url, format='json').data['idea']['likes_status']
+
+    def test_votes_are_buffered_and_flushed(self):
+        print('test_votes_are_buffered_and_flushed-39')
+        etag = self.client.get(self.idea_url, format='json')['ETag']
+        response = self.client.post(self.likes_url, {'likes_status': {'is_like': True}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Likes.objects.exists())
+
+        # ---------- the voter sees the own vote at once, the others after the flush
+        self.assertEqual(self.likes_status_of(self.voter),
+                         {'is_like': True, 'is_unlike': False, 'overall_likes': 1, 'overall_unlikes': 0})
+        self.assertEqual(self.likes_status_of(self.reader),
+                         {'is_like': False, 'is_unlike': False, 'overall_likes': 0, 'overall_unlikes': 0})
+        response = self.client.get(self.idea_url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # ---------- the last vote of the user wins
+        self.client.post(self.likes_url, {'likes_status': {'is_like': False, 'is_unlike': True}}, format='json')
+        self.assertEqual(vote_buffer.flush(), 1)
+        self.assertEqual(list(Likes.objects.values_list('user', 'vote')), [(self.voter.pk, Likes.UNLIKE)])
+        self.idea.refresh_from_db()
+        self.assertEqual((self.idea.overall_likes, self.idea.overall_unlikes), (0, 1))
+        self.assertEqual(self.likes_status_of(self.voter),
+                         {'is_like': False, 'is_unlike': True, 'overall_likes': 0, 'overall_unlikes': 1})
+        self.assertEqual(vote_buffer.flush(), 0)
+
+
+class MailOutboxSendingTest(TransactionTestCase):
+    @override_settings(EMAIL_BACKEND='rest_api.tests.RecordingEmailBackend')
+    def test_mails_are_sent_outside_transactions(self):
+        print('test_mails_are_sent_outside_transactions-40')
+        queued_mail = queue_mail('Subject', 'Body', to=['first@example.com'])
+        RecordingEmailBackend.sends = []
+        self.assertEqual(send_outbox(claim_seconds=300), (1, 0))
+
+        # ---------- claimed and committed before the send, no lock is held while it runs
+        in_atomic_block, send_after = RecordingEmailBackend.sends[0]
+        self.assertFalse(in_atomic_block)
+        self.assertGreater(send_after, queued_mail.send_after + timedelta(seconds=290))
+        queued_mail.refresh_from_db()
+        self.assertIsNotNone(queued_mail.sent_at)
@@ -8,9 +8,15 @@ urlpatterns = [
     path('users/signup/', views.NewUserRegister.as_view(), name='users-add'),
     path('users/activate/', views.NewUserActivate.as_view(), name='user-activate'),
     path('users/<int:pk>/', views.UserDetail.as_view(), name='user-detail'),
+    path('users/<int:pk>/ideas/', views.UserIdeas.as_view(), name='user-ideas'),
     path('ideas/', views.IdeaTools.as_view(), name='idea-tool'),
+    path('ideas/search/', views.IdeaSearch.as_view(), name='idea-search'),
+    path('ideas/hot/', views.HotIdeas.as_view(), name='idea-hot'),
+    path('ideas/export/', views.IdeasExport.as_view(), name='ideas-export'),
     path('ideas/<int:pk>/', views.IdeaTools.as_view(), name='idea-detail'),
     path('ideas/<int:pk>/add-likes/', views.AddLikes.as_view(), name='likes-add'),
+    path('ideas/add-likes/', views.BulkAddLikes.as_view(), name='likes-bulk-add'),
+    path('metrics/', views.Metrics.as_view(), name='metrics'),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
@@ -1,17 +1,37 @@
+import heapq
+from itertools import chain
+from operator import attrgetter
+
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth import get_user_model
 from .serializers import FullCustomUserSerializer, ShortCustomUserSerializer, \
-    IdeaSerializer, LikesSerializer, IdeasListSerializer, UserCreateSerializer, UserActivateSerializer
+    IdeaSerializer, LikesSerializer, IdeasListSerializer, UserCreateSerializer, BulkLikesSerializer, \
+    HotIdeaSerializer, IdeasListFastSerializer
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import permissions
-from .permissions import IsIdeaOwner
-from django.http import Http404
+from rest_framework import permissions, serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .permissions import CanScrapeMetrics, IsIdeaOwner
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.db.models import Count, Max
 from rest_framework.generics import get_object_or_404
 from rest_framework.status import HTTP_201_CREATED
 from .email import mail_confirmation
-
-from ideas_place.models import Idea, Likes
+from .metrics import registry, render_metrics
+from .cache import get_ideas_list
+from .conditional import make_etag, not_modified_response, set_validators
+from .pagination import IdeasCursorPagination
+from .services import activate_user
+from .sqlite import run_write
+
+from ideas_place.models import HotIdea, Idea
+from ideas_place.search import search_idea_ids
+from ideas_place.sharding import group_by_shard, is_sharded, per_shard, shard_for_author, shard_for_idea
+from ideas_place.transfer import export_lines
+from ideas_place.vote_buffer import vote_buffer
+from ideas_place.votes import apply_votes, vote_flags
 
 _usermodel = get_user_model()
 
@@ -21,21 +41,62 @@ _usermodel = get_user_model()
 
 class UserDetail(APIView):
     permission_classes = [permissions.IsAuthenticated, ]
+    first_ideas_count = IdeasCursorPagination.page_size
 
     def get_object(self, pk):
+        # ---------- ideas count and the newest idea id are the cheap validators of the ideas list
+        users = _usermodel.objects.all()
+        if not is_sharded():
+            users = users.annotate(ideas_count=Count('ideas'), last_idea_id=Max('ideas__id'))
         try:
-            return _usermodel.objects.get(pk=pk)
+            author = users.get(pk=pk)
         except _usermodel.DoesNotExist:
             raise Http404
-
-    def get(self, request, pk, format=None):
-        author = self.get_object(pk)
+        if is_sharded():
+            # ---------- the ideas are on the author's shard, not next to the users
+            stats = Idea.objects.using(shard_for_author(author.pk)).filter(author_id=author.pk).aggregate(
+                ideas_count=Count('id'), last_idea_id=Max('id'))
+            author.ideas_count, author.last_idea_id = stats['ideas_count'], stats['last_idea_id']
+        return author
+
+    def get_etag(self, author):
+        return make_etag('user', author.pk, author == self.request.user, author.username, author.email,
+                         author.ideas_count, author.last_idea_id)
+
+    def get_author_data(self, author):
+        # ---------- newest ideas only, over the (author, date_published) index
+        author.first_ideas = list(Idea.objects.using(shard_for_author(author.pk)).filter(author=author).order_by('-date_published', '-id')
+                                  .only('id')[:self.first_ideas_count])
         if author == self.request.user:
             serializer = FullCustomUserSerializer(author, context={'request': self.request})
         else:
             serializer = ShortCustomUserSerializer(author, context={'request': self.request})
+        return {'author': serializer.data}
 
-        return Response({'author': serializer.data})
+    def get(self, request, pk, format=None):
+        author = self.get_object(pk)
+        etag = self.get_etag(author)
+        not_modified = not_modified_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        return set_validators(Response(self.get_author_data(author)), etag=etag)
+
+
+class UserIdeas(APIView):
+    permission_classes = [permissions.IsAuthenticated, ]
+    pagination_class = IdeasCursorPagination
+
+    def get(self, request, pk, format=None):
+        paginator = self.pagination_class()
+        ideas = Idea.objects.using(shard_for_author(pk)).filter(author_id=pk).values(*IdeasListFastSerializer.values_fields())
+        ideas_page = paginator.paginate_queryset(ideas, request, view=self)
+        # ---------- an empty first page is the only case where the author may not exist
+        if not ideas_page and not request.query_params.get(paginator.cursor_query_param) \
+                and not _usermodel.objects.filter(pk=pk).exists():
+            raise Http404
+        serializer = IdeasListFastSerializer(ideas_page, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
 
 class NewUserRegister(APIView):
@@ -58,12 +119,7 @@ class NewUserActivate(APIView):
     def post(self, request, format=None):
         # new_user = request.data.get('new_user', None)
         activation_data = request.data.get('activation', None)
-        serializer = UserActivateSerializer(data=activation_data)
-        serializer.is_valid(raise_exception=True)
-
-        user = serializer.user
-        user.is_active = True
-        user.save()
+        user = activate_user(activation_data)
 
         return Response({'success': 'User {} successfully activated'.format(user.username)})
 
@@ -71,22 +127,75 @@ class NewUserActivate(APIView):
 class IdeaTools(APIView):
     my_model = Idea
     permission_classes = [permissions.IsAuthenticated, IsIdeaOwner, ]
+    pagination_class = IdeasCursorPagination
 
     def get_object(self, pk):
+        fields = self.get_requested_fields(IdeaSerializer)
+        ideas = self.my_model.objects.using(shard_for_idea(pk))
+        if fields is not None:
+            # ---------- updated_at is the Last-Modified validator
+            ideas = ideas.only('updated_at', *IdeaSerializer.model_fields(fields))
+        if fields is None or 'likes_status' in fields:
+            # ---------- the idea, its counters and the caller's own vote in one query
+            ideas = ideas.with_vote_of(self.request.user)
         try:
-            return self.my_model.objects.get(pk=pk)
+            return ideas.get(pk=pk)
         except Idea.DoesNotExist:
             raise Http404
 
+    def get_requested_fields(self, serializer_class):
+        """
+        Return the serializer fields listed by the `fields` query parameter, None for all of them.
+        """
+        value = self.request.query_params.get('fields', '')
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        if not fields:
+            return None
+        unknown = sorted(set(fields) - set(serializer_class.Meta.fields))
+        if unknown:
+            raise ValidationError({'fields': ['Unknown field(s): {}'.format(', '.join(unknown))]})
+        return fields
+
     def get(self, request, pk=None, format=None):
         if pk is not None:
             idea = self.get_object(pk)
-            serializer = IdeaSerializer(idea, context={'request': self.request, 'current_user': request.user})
-            return Response({'idea': serializer.data})
+            etag = self.get_idea_etag(idea)
+            last_modified = self.get_idea_last_modified(idea)
+            not_modified = not_modified_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            return set_validators(Response(self.get_idea_data(idea)), etag=etag, last_modified=last_modified)
         else:
-            all_ideas = self.my_model.objects.all()
-            serializer = IdeasListSerializer(all_ideas, context={'request': self.request}, many=True)
-            return Response({'all_ideas': serializer.data})
+            data, hit = get_ideas_list(request, self.get_ideas_list_data)
+            return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+    def get_idea_etag(self, idea):
+        # ---------- the caller's own vote and the requested fields are a part of the representation
+        return make_etag('idea', idea.pk, idea.updated_at.isoformat(), self.request.user.pk,
+                         self.get_requested_fields(IdeaSerializer),
+                         vote_buffer.pending_vote(idea.pk, self.request.user.pk))
+
+    def get_idea_last_modified(self, idea):
+        # ---------- the caller's unflushed vote changes the representation, not updated_at
+        if vote_buffer.pending_vote(idea.pk, self.request.user.pk) is not None:
+            return None
+        return idea.updated_at
+
+    def get_idea_data(self, idea):
+        serializer = IdeaSerializer(idea, context={'request': self.request, 'current_user': self.request.user},
+                                    fields=self.get_requested_fields(IdeaSerializer))
+        return {'idea': serializer.data}
+
+    def get_ideas_list_data(self):
+        fields = self.get_requested_fields(IdeasListSerializer)
+        paginator = self.pagination_class()
+        # ---------- plain rows, i_text is never listed, date_published and id are the cursor position
+        ideas = self.my_model.objects.values('id', 'date_published', *IdeasListFastSerializer.values_fields(fields))
+        # ---------- one stream per shard, merged by (date_published, id)
+        ideas_page = paginator.paginate_querysets(per_shard(ideas), self.request, view=self)
+        serializer = IdeasListFastSerializer(ideas_page, context={'request': self.request}, fields=fields)
+        return paginator.get_paginated_data(serializer.data)
 
     def post(self, request, format=None):
         new_idea = request.data.get('new_idea', None)
@@ -96,43 +205,155 @@ class IdeaTools(APIView):
         return Response({'success': "The Idea {} saved".format(idea_saved.i_title)}, status=HTTP_201_CREATED)
 
     def put(self, request, pk):
-        saved_idea = get_object_or_404(self.my_model.objects.all(), pk=pk)
+        saved_idea = get_object_or_404(self.my_model.objects.using(shard_for_idea(pk)), pk=pk)
         # check object permission
         self.check_object_permissions(self.request, saved_idea)
         updated_idea_data = request.data.get('updated_idea')
         serializer = IdeaSerializer(instance=saved_idea, data=updated_idea_data, partial=True)
 
         if serializer.is_valid(raise_exception=True):
-            idea_saved = serializer.save()
+            idea_saved = run_write(serializer.save)
         return Response({'success': 'The Idea {} updated successfully'.format(idea_saved.i_title)})
 
     def delete(self, request, pk):
-        idea = get_object_or_404(self.my_model.objects.all(), pk=pk)
+        idea = get_object_or_404(self.my_model.objects.using(shard_for_idea(pk)), pk=pk)
         # check object permission
         self.check_object_permissions(self.request, idea)
         idea.delete()
         return Response({'success': 'The Idea with id={} disappeared'.format(pk)})
 
 
+class IdeaSearch(APIView):
+    permission_classes = [permissions.IsAuthenticated, ]
+    page_size = 20
+    max_page_size = 100
+
+    @staticmethod
+    def get_positive_int(request, name, default, maximum=None):
+        try:
+            value = int(request.query_params[name])
+        except (KeyError, ValueError):
+            return default
+        if value <= 0:
+            return default
+        return min(value, maximum) if maximum is not None else value
+
+    def get(self, request, format=None):
+        query = request.query_params.get('q', '')
+        page = self.get_positive_int(request, 'page', 1)
+        page_size = self.get_positive_int(request, 'page_size', self.page_size, self.max_page_size)
+
+        # ---------- ranked ids come from the full-text index, one extra id tells if there is a next page
+        found_ids = search_idea_ids(query, limit=page_size + 1, offset=(page - 1) * page_size)
+        page_ids = found_ids[:page_size]
+        rows = Idea.objects.filter(pk__in=page_ids).values(*IdeasListFastSerializer.values_fields())
+        found_rows = {row['id']: row for row in rows}
+        serializer = IdeasListFastSerializer([found_rows[pk] for pk in page_ids if pk in found_rows],
+                                             context={'request': self.request})
+
+        url = request.build_absolute_uri()
+        next_link = replace_query_param(url, 'page', page + 1) if len(found_ids) > page_size else None
+        if page == 1:
+            previous_link = None
+        elif page == 2:
+            previous_link = remove_query_param(url, 'page')
+        else:
+            previous_link = replace_query_param(url, 'page', page - 1)
+        return Response({'ideas': serializer.data, 'next': next_link, 'previous': previous_link})
+
+
+class HotIdeas(APIView):
+    permission_classes = [permissions.IsAuthenticated, ]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, format=None):
+        limit = IdeaSearch.get_positive_int(request, 'limit', self.default_limit, self.max_limit)
+        # ---------- top of the materialized ranking, one query over the score index of every shard
+        rankings = per_shard(HotIdea.objects.select_related('idea').order_by('-score'))
+        hot_ideas = heapq.nlargest(limit, chain.from_iterable(ranking[:limit] for ranking in rankings),
+                                   key=attrgetter('score'))
+        ideas = [hot_idea.idea for hot_idea in hot_ideas]
+        serializer = HotIdeaSerializer(ideas, context={'request': self.request}, many=True)
+        return Response({'hot_ideas': serializer.data})
+
+
+class IdeasExport(APIView):
+    permission_classes = [permissions.IsAdminUser, ]
+
+    def get(self, request, format=None):
+        response = StreamingHttpResponse(export_lines(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="ideas.ndjson"'
+        return response
+
+
+class Metrics(APIView):
+    # ---------- scraped with METRICS_TOKEN or from METRICS_ALLOWED_IPS, not with the users' JWT
+    authentication_classes = []
+    permission_classes = [CanScrapeMetrics, ]
+
+    def get(self, request, format=None):
+        if not getattr(settings, 'METRICS', False):
+            raise Http404
+        return HttpResponse(render_metrics(registry), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class AddLikes(APIView):
     permission_classes = [permissions.IsAuthenticated, ]
 
     def post(self, request, format=None, **kwargs):
 
         parent_idea = self.kwargs.get('pk', None)
-        user = request.user.id
-        try:
-            related_like = Likes.objects.get(parent_idea=parent_idea, user=user)
-        except:
-            related_like = None
-
         likes_status = request.data.get('likes_status', {})
-        if related_like is not None:
-            serializer = LikesSerializer(instance=related_like, data=likes_status, partial=True)
-        else:
-            likes_status.update({'parent_idea': parent_idea, 'user': user})
-            serializer = LikesSerializer(data=likes_status)
+        likes_status.update({'parent_idea': parent_idea})
+        serializer = LikesSerializer(data=likes_status)
 
         if serializer.is_valid(raise_exception=True):
-            serializer.save()
+            # ---------- single upsert of the (idea, user) row, see ideas_place.votes.apply_votes,
+            # on the writer thread with SQLITE_WRITE_QUEUE (see rest_api.sqlite)
+            run_write(serializer.save, user=request.user)
         return Response({'success': "Likes status for idea`s id={} saved".format(parent_idea)})
+
+
+class BulkAddLikes(APIView):
+    permission_classes = [permissions.IsAuthenticated, ]
+    max_batch_size = 500
+
+    def post(self, request, format=None):
+        likes_statuses = request.data.get('likes_statuses', None)
+        if not isinstance(likes_statuses, list):
+            raise ValidationError({'likes_statuses': ['Expected a list of likes statuses.']})
+        if len(likes_statuses) > self.max_batch_size:
+            raise ValidationError({'likes_statuses': ['Ensure this list has no more than {} elements.'.format(
+                self.max_batch_size)]})
+
+        results = [None] * len(likes_statuses)
+        valid_items = []
+        for position, likes_status in enumerate(likes_statuses):
+            serializer = BulkLikesSerializer(data=likes_status)
+            if serializer.is_valid():
+                valid_items.append((position, serializer.validated_data))
+            else:
+                results[position] = {'errors': serializer.errors}
+
+        # ---------- one query (per shard) checks all the ideas of the batch
+        requested_ideas = {item['idea_id'] for _, item in valid_items}
+        existing_ideas = set()
+        for using, idea_ids in group_by_shard(requested_ideas).items():
+            existing_ideas.update(Idea.objects.using(using).filter(pk__in=idea_ids).values_list('pk', flat=True))
+
+        votes = []
+        for position, item in valid_items:
+            idea_id = item.pop('idea_id')
+            if idea_id not in existing_ideas:
+                message = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+                results[position] = {'idea_id': idea_id, 'errors': {'idea_id': [message.format(pk_value=idea_id)]}}
+            else:
+                votes.append((position, idea_id, item))
+
+        saved = run_write(apply_votes, [(idea_id, request.user.id, item) for _, idea_id, item in votes])
+        for position, idea_id, _ in votes:
+            is_like, is_unlike = vote_flags(saved[(idea_id, request.user.id)])
+            results[position] = {'idea_id': idea_id, 'likes_status': {'is_like': is_like, 'is_unlike': is_unlike}}
+
+        return Response({'results': results})
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'share_ideas.settings')
 
 application = get_asgi_application()
+
+# ---------- read endpoints are served by native async handlers (see rest_api.async_views)
+from rest_api.async_views import AsyncReadRouter  # noqa: E402
+
+application = AsyncReadRouter(application)
@@ -51,6 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rest_api.middleware.MetricsMiddleware',
+    'rest_api.middleware.RequestTimingMiddleware',
+    'rest_api.middleware.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,10 +63,35 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per request query count and SQL/view/render times, logged to 'rest_api.timing' (see rest_api.middleware),
+# REQUEST_TIMING_HEADER also sends them to the clients in the Server-Timing header
+REQUEST_TIMING = os.environ.get('REQUEST_TIMING') == '1'
+REQUEST_TIMING_HEADER = os.environ.get('REQUEST_TIMING_HEADER') == '1'
+
+# Request counts and latencies by URL name, scraped at /api/v1/metrics/ (see rest_api.metrics),
+# with several worker processes set METRICS_DIR to a directory shared by all of them.
+# The scraper sends METRICS_TOKEN as a Bearer token or comes from one of METRICS_ALLOWED_IPS
+METRICS = os.environ.get('METRICS') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 1.0
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'rest_api.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 REST_FRAMEWORK = {
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rest_api.authentication.CachedJWTAuthentication',
     ),
     # Use Django's standard `django.contrib.auth` permissions,
     # or allow read-only access for unauthenticated users.
@@ -114,6 +142,69 @@ DATABASES = {
     }
 }
 
+# Set on every new SQLite connection (see rest_api.sqlite), mmap_size in bytes, a negative cache_size in KiB.
+# SQLITE_WRITE_QUEUE runs the votes and the idea edits of a process on one writer thread,
+# up to SQLITE_WRITE_QUEUE_BATCH_SIZE of them in a transaction
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'busy_timeout': 5000,
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+SQLITE_WRITE_QUEUE = os.environ.get('SQLITE_WRITE_QUEUE') == '1'
+SQLITE_WRITE_QUEUE_BATCH_SIZE = 100
+
+# VOTE_BUFFER keeps the single votes in the worker's memory and saves them in batches every
+# VOTE_BUFFER_FLUSH_MS or after VOTE_BUFFER_MAX_EVENTS votes (see ideas_place.vote_buffer)
+VOTE_BUFFER = os.environ.get('VOTE_BUFFER') == '1'
+VOTE_BUFFER_FLUSH_MS = 200
+VOTE_BUFFER_MAX_EVENTS = 500
+
+# Reads go to the DATABASE_REPLICAS aliases of DATABASES, writes to 'default' (see rest_api.db_router).
+# A user who has written reads from 'default' for REPLICA_PIN_SECONDS, keep it above the replication lag,
+# and make REPLICA_PIN_CACHE_ALIAS a cache shared by the workers, the start fails with a per process one
+DATABASE_ROUTERS = ['ideas_place.sharding.IdeaShardRouter', 'rest_api.db_router.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_CACHE_ALIAS = 'default'
+
+# Ideas, likes and hot scores are spread over the IDEA_SHARDS aliases of DATABASES by a hash of the
+# author id (see ideas_place.sharding), users stay on 'default'. Empty keeps everything on 'default'.
+# Fixed once ideas are stored: the idea ids encode their shard
+IDEA_SHARDS = []
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# locmem is per process, use the file based cache to share the ideas list pages between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'share-ideas',
+    },
+    # authenticated users of the JWT requests, see rest_api.authentication
+    'users': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'share-ideas-users',
+        'TIMEOUT': 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+IDEAS_LIST_CACHE_ALIAS = 'default'
+IDEAS_LIST_CACHE_TIMEOUT = 300
+
+JWT_USER_CACHE_ALIAS = 'users'
+
+# Hot ideas ranking: every HOT_IDEAS_DECAY_SECONDS of age weighs as much as ten times the net votes
+HOT_IDEAS_DECAY_SECONDS = 45000
+
+# Threads running the database work of the async read endpoints (see share_ideas.asgi),
+# keep it below the database connections limit, every thread holds its own connection
+ASYNC_DB_POOL_SIZE = 8
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -133,7 +224,9 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Mails are queued in the rest_api outbox and delivered by `manage.py send_outbox`,
+# set EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend to print them locally
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_USE_TLS = True
 EMAIL_HOST = 'smtp.gmail.com'
 # EMAIL_HOST_USER = 'uvfilm19@gmail.com'
@@ -2,14 +2,37 @@ from django.db import models
 
 # Create your models here.
 
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.dispatch import Signal
 from django.utils.translation import ugettext_lazy as _
 
+# ---------- the fields deciding the authentication and the permissions of a user
+AUTH_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+
+# ---------- sent with `user_ids` after a queryset update() of AUTH_FIELDS, which sends no post_save
+auth_fields_updated = Signal()
+
+
+class CustomUserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        if not set(AUTH_FIELDS) & kwargs.keys():
+            return super().update(**kwargs)
+        user_ids = list(self.values_list('pk', flat=True))
+        updated = super().update(**kwargs)
+        auth_fields_updated.send(sender=self.model, user_ids=user_ids)
+        return updated
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
+    pass
+
 
 class CustomUser(AbstractUser):
 
     email = models.EmailField(_('email address'), unique=True)
 
+    objects = CustomUserManager()
+
     def __str__(self):
         return self.username
 